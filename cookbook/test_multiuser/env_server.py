@@ -13,7 +13,7 @@ Architecture:
 """
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Set
+from typing import List, Dict, Any, Optional, Set, Tuple
 import threading
 from datetime import datetime
 import asyncio
@@ -30,6 +30,11 @@ message_history: List[Dict[str, Any]] = []
 agent_registry: Dict[str, datetime] = {}  # Track agent activity
 lock = threading.Lock()  # Thread-safe access for messages
 
+# Long-poll support: /messages/poll with wait > 0 blocks on the agent's event
+# until a message is delivered (at most MAX_POLL_WAIT seconds)
+mailbox_events: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = {}
+MAX_POLL_WAIT = 30.0
+
 # ==============================================================================
 # Synchronization System
 # ==============================================================================
@@ -73,12 +78,21 @@ class SendMessageRequest(BaseModel):
 
 class PollMessagesRequest(BaseModel):
     agent_id: str
+    wait: float = 0.0  # Seconds to wait for a message if the mailbox is empty (long-poll)
 
 
 class PollMessagesResponse(BaseModel):
     messages: List[Dict[str, Any]]
 
 
+class PollMessagesBatchRequest(BaseModel):
+    agents: List[str]
+
+
+class PollMessagesBatchResponse(BaseModel):
+    messages: Dict[str, List[Dict[str, Any]]]  # {agent_id: [msg1, msg2, ...]}
+
+
 # ==============================================================================
 # Synchronization Request/Response Models
 # ==============================================================================
@@ -159,12 +173,14 @@ async def send_message(request: SendMessageRequest):
                 if agent_id not in message_mailboxes:
                     message_mailboxes[agent_id] = []
                 message_mailboxes[agent_id].append(msg.copy())
+                _wake(agent_id)
         else:
             # Send to specific agent (but not if it's the sender)
             if request.recipient != request.sender:
                 if request.recipient not in message_mailboxes:
                     message_mailboxes[request.recipient] = []
                 message_mailboxes[request.recipient].append(msg.copy())
+                _wake(request.recipient)
         
         return {"status": "sent", "recipient": request.recipient}
 
@@ -176,30 +192,73 @@ async def poll_messages(request: PollMessagesRequest):
     
     Returns all messages in the agent's mailbox and clears the mailbox.
     Messages sent by the agent itself are filtered out.
+    With wait > 0 and an empty mailbox, holds the request until a message
+    arrives or wait seconds pass (long-poll), instead of returning empty.
     """
     with lock:
-        # Register agent if not already registered
-        agent_registry[request.agent_id] = datetime.now()
-        
-        # Get agent's mailbox
-        mailbox = message_mailboxes.get(request.agent_id, [])
-        
-        # Filter out self-messages (safety check)
-        messages = [
-            {
-                "sender": msg.get("sender"),
-                "recipient": msg.get("recipient"),
-                "message": msg.get("message"),
-                "timestamp": msg.get("timestamp")
-            }
-            for msg in mailbox
-            if msg.get("sender") != request.agent_id
-        ]
-        
-        # Clear the mailbox after reading
-        message_mailboxes[request.agent_id] = []
-        
-        return PollMessagesResponse(messages=messages)
+        messages = _drain_mailbox(request.agent_id)
+        if messages or request.wait <= 0:
+            return PollMessagesResponse(messages=messages)
+        event = asyncio.Event()
+        mailbox_events[request.agent_id] = (asyncio.get_running_loop(), event)
+    
+    try:
+        await asyncio.wait_for(event.wait(), timeout=min(request.wait, MAX_POLL_WAIT))
+    except asyncio.TimeoutError:
+        pass
+    
+    with lock:
+        waiter = mailbox_events.get(request.agent_id)
+        if waiter is not None and waiter[1] is event:
+            del mailbox_events[request.agent_id]
+        return PollMessagesResponse(messages=_drain_mailbox(request.agent_id))
+
+
+@app.post("/messages/poll_batch", response_model=PollMessagesBatchResponse)
+async def poll_messages_batch(request: PollMessagesBatchRequest):
+    """
+    Poll messages for several agents in one request.
+    
+    Same as /messages/poll for each agent in request.agents.
+    """
+    with lock:
+        return PollMessagesBatchResponse(
+            messages={agent_id: _drain_mailbox(agent_id) for agent_id in request.agents}
+        )
+
+
+def _wake(agent_id: str):
+    """Release long-polls waiting on an agent's mailbox (caller holds lock)."""
+    waiter = mailbox_events.pop(agent_id, None)
+    if waiter is not None:
+        loop, event = waiter
+        loop.call_soon_threadsafe(event.set)
+
+
+def _drain_mailbox(agent_id: str) -> List[Dict[str, Any]]:
+    """Return an agent's messages and clear its mailbox (caller holds lock)."""
+    # Register agent if not already registered
+    agent_registry[agent_id] = datetime.now()
+    
+    # Get agent's mailbox
+    mailbox = message_mailboxes.get(agent_id, [])
+    
+    # Filter out self-messages (safety check)
+    messages = [
+        {
+            "sender": msg.get("sender"),
+            "recipient": msg.get("recipient"),
+            "message": msg.get("message"),
+            "timestamp": msg.get("timestamp")
+        }
+        for msg in mailbox
+        if msg.get("sender") != agent_id
+    ]
+    
+    # Clear the mailbox after reading
+    message_mailboxes[agent_id] = []
+    
+    return messages
 
 
 @app.get("/messages/history")
@@ -42,6 +42,18 @@ import numpy as np
 import requests
 
 
+def get_perception_type(perception) -> str:
+    """
+    Perception type ("mock", "unity-camera", ...) without an environment-info call per tick.
+    
+    Uses the class-level perception_type; only implementations that don't declare
+    it fall back to get_environment_info().
+    """
+    if perception is None:
+        return ""
+    return getattr(perception, "perception_type", "") or perception.get_environment_info().get("type", "")
+
+
 def find_previous_screenshot(current_screenshot_path: str, agent_id: str) -> str:
     """
     Find the previous screenshot for the given agent based on timestamp.
@@ -63,9 +75,9 @@ def find_previous_screenshot(current_screenshot_path: str, agent_id: str) -> str
         return ""
     
     # Find all screenshots for this agent in the same directory
-    # Pattern: {agent_id}_*.png
-    pattern = str(screenshot_dir / f"{agent_id}_*.png")
-    all_screenshots = glob.glob(pattern)
+    # Pattern: {agent_id}_*.{png,jpg,webp} (the extension follows screenshot_format)
+    pattern = str(screenshot_dir / f"{agent_id}_*")
+    all_screenshots = [p for p in glob.glob(pattern) if p.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))]
     
     if len(all_screenshots) < 2:
         # No previous screenshot available
@@ -163,7 +175,7 @@ class PerceptionNode(Node):
         unity_output_base_path = prep_res["unity_output_base_path"]
         
         # === Check Unity window health (only for modes that require Unity window) ===
-        perception_type = perception.get_environment_info().get("type", "")
+        perception_type = get_perception_type(perception)
         if perception_type in ["unity", "unity-camera"]:
             window_health = self._check_unity_window_health()
             if not window_health.get("healthy", True):
@@ -668,7 +680,7 @@ class SharedMemoryRetrieveNode(Node):
                 if isinstance(key, str) and key.startswith("screenshot:"):
                     screenshot_path = key.split("screenshot:", 1)[1]
                     break
-        elif isinstance(visible_objects, list):
+        elif isinstance(visible_objects, (list, tuple)):
             for item in visible_objects:
                 if isinstance(item, str) and item.startswith("screenshot:"):
                     screenshot_path = item.split("screenshot:", 1)[1]
@@ -678,7 +690,7 @@ class SharedMemoryRetrieveNode(Node):
         if not screenshot_path:
             # Try to find from current observation
             raw_visible = private_property.get("visible_objects", [])
-            if isinstance(raw_visible, list) and raw_visible:
+            if isinstance(raw_visible, (list, tuple)) and raw_visible:
                 first_item = raw_visible[0]
                 if isinstance(first_item, str) and first_item.startswith("screenshot:"):
                     screenshot_path = first_item.split("screenshot:", 1)[1]
@@ -761,7 +773,7 @@ class SharedMemoryRetrieveNode(Node):
                         "name": obj_name,
                         "position": position
                     })
-        elif isinstance(visible_objects, (list, set)):
+        elif isinstance(visible_objects, (list, tuple, set)):
             for obj in visible_objects:
                 if isinstance(obj, str):
                     objects_to_process.append({
@@ -968,7 +980,7 @@ class DecisionNode(Node):
             "relative_positions": private_property.get("relative_positions", {}),  # Add relative positions
             "explored_objects": list(private_property["explored_objects"]),
             "step_count": private_property["step_count"],
-            "perception_type": private_property.get("perception", {}).get_environment_info().get("type", "unknown"),
+            "perception_type": get_perception_type(private_property.get("perception")) or "unknown",
             "action_history": private_property.get("action_history", []),  # Add action history to context
             "env_change": private_property.get("env_change", []),  # Add environment change history
             "movement_limits": private_property.get("movement_limits"),
@@ -1212,7 +1224,8 @@ message_to_others: Information to share with other agents (optional)
         for _ in range(max_loop):
             prompt = build_prompt(forbidden_actions)
             try:
-                response = call_llm(prompt)
+                # Only the first ```yaml block is parsed, so stop reading once it closes
+                response = call_llm(prompt, stop_after_yaml=True)
             except Exception as e:
                 error_str = str(e).lower()
                 # Check for API quota/balance errors
@@ -1432,7 +1445,7 @@ class UpdateMemoryNode(Node):
                 obj for obj in visible_objects.keys()
                 if isinstance(obj, str) and not obj.startswith("screenshot:")
             ]
-        elif isinstance(visible_objects, (list, set)):
+        elif isinstance(visible_objects, (list, tuple, set)):
             # Filter out screenshot paths (in case extraction failed)
             objects_list = [
                 obj for obj in visible_objects 
@@ -9,25 +9,56 @@ Provides endpoints for:
 - Retrieving entity information
 
 Uses dual FAISS indices (visual + description) with configurable fusion weights.
+All incoming feature vectors are L2-normalized on ingest and at query time, so
+inner-product scores are cosine similarities regardless of what callers send.
 """
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import Counter, defaultdict
+import asyncio
+import bisect
+import itertools
+import os
 import threading
 import numpy as np
 import faiss
 import uuid
 import json
 from datetime import datetime
+from pathlib import Path
 
 from utils.shared_memory_types import (
     SharedMemoryEntity,
-    SharedMemoryConfig,
-    NumpyJSONEncoder
+    SharedMemoryConfig
 )
 from utils.config_loader import get_config_value
 
-app = FastAPI(title="Shared Memory Server", version="1.0.0")
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (numpy arrays/scalars serialize natively)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+app = FastAPI(
+    title="Shared Memory Server",
+    version="1.0.0",
+    # Fall back to the stdlib JSON response when orjson is not installed
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse
+)
 
 # ========== Global State ==========
 # Load configuration from config file with defaults
@@ -55,18 +86,134 @@ description_index: Optional[faiss.Index] = None  # For description_embedding
 # Entity storage (maps entity_id -> SharedMemoryEntity)
 entities: Dict[str, SharedMemoryEntity] = {}
 
+class FaissIdMap:
+    """
+    Maps FAISS sequential positions to entity ids, and entity ids back to positions.
+    
+    Ids live in a geometrically grown numpy object array so search results can be
+    resolved with one vectorized gather instead of a per-row Python list lookup.
+    """
+    
+    def __init__(self, capacity: int = 1024):
+        self.ids = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.positions: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return self.size
+    
+    def append(self, entity_id: str):
+        if self.size == len(self.ids):
+            grown = np.empty(2 * len(self.ids), dtype=object)
+            grown[:self.size] = self.ids[:self.size]
+            self.ids = grown
+        self.ids[self.size] = entity_id
+        self.positions[entity_id] = self.size
+        self.size += 1
+    
+    def clear(self):
+        self.ids[:self.size] = None
+        self.size = 0
+        self.positions.clear()
+
+
 # ID mapping for FAISS indices (FAISS uses sequential integer IDs)
-# Maps FAISS index position -> entity_id
-visual_id_map: List[str] = []
-description_id_map: List[str] = []
+# Maps FAISS index position <-> entity_id
+visual_id_map = FaissIdMap()
+description_id_map = FaissIdMap()
+
+
+class PendingBatch:
+    """
+    Normalized vectors waiting to be bulk-added to a FAISS index.
+    
+    Adds are buffered here and flushed with a single index.add() call; until then
+    searches scan the batch with one matrix-vector product and merge the results.
+    """
+    
+    def __init__(self):
+        self.vectors: List[np.ndarray] = []
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def append(self, entity_id: str, vector: np.ndarray):
+        self.positions[entity_id] = len(self.ids)
+        self.vectors.append(vector)
+        self.ids.append(entity_id)
+    
+    def search(self, features: np.ndarray, k: int) -> List[tuple]:
+        """Brute-force top-k over the pending vectors; returns (entity_id, similarity) tuples."""
+        if not self.ids or k <= 0:
+            return []
+        scores = np.vstack(self.vectors) @ features[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [(self.ids[i], s) for i, s in zip(top.tolist(), scores[top].tolist())]
+    
+    def flush_into(self, index: faiss.Index, id_map: FaissIdMap):
+        """Add all pending vectors to the index in one call and register their ids."""
+        if not self.ids:
+            return
+        index.add(np.vstack(self.vectors))
+        for entity_id in self.ids:
+            id_map.append(entity_id)
+        self.clear()
+    
+    def clear(self):
+        self.vectors.clear()
+        self.ids.clear()
+        self.positions.clear()
+
+
+# Vectors added since the last flush, one batch per index
+visual_pending = PendingBatch()
+description_pending = PendingBatch()
+
+# Recency index for /entities/list, kept sorted ascending by
+# (last_updated, -insertion_seq, entity_id) so the newest entities sit at the end
+# and ties keep insertion order, matching a stable descending sort
+recency: List[Tuple[int, int, str]] = []
+recency_keys: Dict[str, Tuple[int, int, str]] = {}
+_insertion_seq = itertools.count()
+
+# Reverse index: agent_id -> ids of entities that agent has discovered or revisited
+agent_to_entities: Dict[str, Set[str]] = defaultdict(set)
+
+# Running entity count per entity_type (entity types never change after creation)
+type_counts: Counter = Counter()
 
 # Global lock for thread-safe access
 lock = threading.Lock()
 
+# Above this many vectors, single-query search runs as one BLAS matrix-vector
+# product (threaded by MKL/OpenBLAS) instead of FAISS's per-query scan
+BLAS_SEARCH_THRESHOLD = int(os.getenv("FAISS_BLAS_THRESHOLD", "50000"))
+
+# Below this many vectors, FAISS's per-call setup dominates; use a numba kernel
+# specialized for the index dimension instead (only when numba is installed)
+KERNEL_SEARCH_THRESHOLD = int(os.getenv("IP_KERNEL_THRESHOLD", "1024"))
+
+# Dimension -> compiled inner-product kernel, see gen_ip_kernel()
+_ip_kernels: Dict[int, Any] = {}
+
+# Periodic snapshots of indices + entities so restarts don't rebuild from scratch.
+# Disabled unless SHARED_MEMORY_SNAPSHOT_DIR is set.
+SNAPSHOT_DIR = os.getenv("SHARED_MEMORY_SNAPSHOT_DIR", "")
+SNAPSHOT_INTERVAL = float(os.getenv("SHARED_MEMORY_SNAPSHOT_INTERVAL", "60"))
+_snapshot_dirty = False
+
+# Pending adds are flushed every FLUSH_INTERVAL seconds, or immediately once a
+# batch holds MAX_PENDING vectors (bounds the brute-force scan at search time)
+FLUSH_INTERVAL = float(os.getenv("SHARED_MEMORY_FLUSH_INTERVAL", "0.05"))
+MAX_PENDING = int(os.getenv("SHARED_MEMORY_MAX_PENDING", "256"))
+
 
 # ========== Pydantic Models ==========
 class SearchRequest(BaseModel):
-    """Request model for searching entities."""
+    """Request model for searching entities (features need not be pre-normalized)."""
     visual_features: Optional[List[float]] = None
     description_embedding: Optional[List[float]] = None
     top_k: int = 10
@@ -149,10 +296,17 @@ def initialize_indices():
     """Initialize FAISS indices."""
     global visual_index, description_index
     
+    faiss.omp_set_num_threads(int(os.getenv("FAISS_THREADS", str(os.cpu_count() or 1))))
+    
     # Use IndexFlatIP for cosine similarity (inner product on normalized vectors)
     visual_index = faiss.IndexFlatIP(config.visual_feature_dim)
     description_index = faiss.IndexFlatIP(config.description_embedding_dim)
     
+    if numba is not None:
+        for dim in (config.visual_feature_dim, config.description_embedding_dim):
+            if dim not in _ip_kernels:
+                _ip_kernels[dim] = gen_ip_kernel(dim)
+    
     print(f"[SharedMemory] Initialized FAISS indices:")
     print(f"  - Visual index: {config.visual_feature_dim} dimensions")
     print(f"  - Description index: {config.description_embedding_dim} dimensions")
@@ -164,26 +318,112 @@ def compute_combined_score(visual_sim: float, desc_sim: float) -> float:
     return alpha * visual_sim + (1 - alpha) * desc_sim
 
 
+def _normalize_rows(features) -> np.ndarray:
+    """Return features as a new contiguous float32 (n, d) array with L2-normalized rows."""
+    rows = np.array(features, dtype=np.float32, ndmin=2)
+    faiss.normalize_L2(rows)
+    return rows
+
+
+def register_entity(entity: SharedMemoryEntity):
+    """Store an entity and add it to the recency, per-agent and per-type indices."""
+    entities[entity.entity_id] = entity
+    touch_recency(entity)
+    for agent_id in entity.inferred_properties.get("discovered_by_agents", []):
+        agent_to_entities[agent_id].add(entity.entity_id)
+    type_counts[entity.entity_type] += 1
+
+
+def touch_recency(entity: SharedMemoryEntity):
+    """Insert or move an entity in the recency index after its last_updated changed."""
+    old_key = recency_keys.get(entity.entity_id)
+    if old_key is not None:
+        del recency[bisect.bisect_left(recency, old_key)]
+        seq = old_key[1]
+    else:
+        seq = -next(_insertion_seq)
+    key = (entity.last_updated, seq, entity.entity_id)
+    bisect.insort(recency, key)
+    recency_keys[entity.entity_id] = key
+
+
+def gen_ip_kernel(dim: int):
+    """
+    Compile an inner-product kernel for one fixed dimension.
+    
+    `dim` is a closure constant, so numba sees a compile-time trip count and can
+    fully vectorize/unroll the inner loop. Compiled eagerly so startup pays the cost.
+    """
+    @numba.njit(fastmath=True)
+    def ip_kernel(stored, query):
+        n = stored.shape[0]
+        out = np.empty(n, dtype=np.float32)
+        for i in range(n):
+            acc = np.float32(0.0)
+            for j in range(dim):
+                acc += stored[i, j] * query[j]
+            out[i] = acc
+        return out
+    
+    ip_kernel(np.zeros((1, dim), dtype=np.float32), np.zeros(dim, dtype=np.float32))
+    return ip_kernel
+
+
+def _stored_vectors(index: faiss.Index) -> np.ndarray:
+    """Writable (ntotal, d) view of a flat index's vector storage (no copy)."""
+    return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+
+
+def _flat_search(index: faiss.Index, features: np.ndarray, k: int):
+    """
+    Search a flat IP index with the cheapest backend for its size.
+    
+    - Small indices: dimension-specialized numba kernel (skips FAISS call setup)
+    - Large indices: BLAS matrix-vector product. FAISS parallelizes flat search
+      over queries, so a single query scans the database on one core; numpy's
+      threaded gemv scans it on all of them.
+    - Otherwise: FAISS
+    """
+    kernel = _ip_kernels.get(index.d)
+    if kernel is not None and index.ntotal < KERNEL_SEARCH_THRESHOLD:
+        scores = kernel(_stored_vectors(index), features[0])
+    elif index.ntotal > BLAS_SEARCH_THRESHOLD:
+        scores = _stored_vectors(index) @ features[0]
+    else:
+        return index.search(features, k)
+    
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return scores[top][None, :], top[None, :].astype(np.int64)
+
+
 def search_visual_index(features: np.ndarray, top_k: int) -> List[tuple]:
     """
     Search visual index.
     
     Returns: List of (entity_id, similarity) tuples
     """
-    if visual_index is None or visual_index.ntotal == 0:
+    if visual_index is None or visual_index.ntotal + len(visual_pending) == 0:
         return []
     
-    features = features.reshape(1, -1).astype('float32')
-    k = min(top_k, visual_index.ntotal)
+    features = _normalize_rows(features)
+    results = visual_pending.search(features, top_k)
     
-    # FAISS IndexFlatIP returns inner product (similarity for normalized vectors)
-    similarities, indices = visual_index.search(features, k)
+    if visual_index.ntotal > 0:
+        k = min(top_k, visual_index.ntotal)
+        # FAISS IndexFlatIP returns inner product (similarity for normalized vectors)
+        similarities, indices = _flat_search(visual_index, features, k)
+        
+        # Drop FAISS padding (-1) and gather entity ids in one vectorized step
+        valid = (indices[0] >= 0) & (indices[0] < len(visual_id_map))
+        entity_ids = visual_id_map.ids[indices[0][valid]]
+        sims = similarities[0][valid]
+        results += zip(entity_ids.tolist(), sims.tolist())
     
-    results = []
-    for sim, idx in zip(similarities[0], indices[0]):
-        if idx >= 0 and idx < len(visual_id_map):
-            entity_id = visual_id_map[idx]
-            results.append((entity_id, float(sim)))
+    if len(visual_pending):
+        # Merge indexed and pending hits
+        results.sort(key=lambda r: r[1], reverse=True)
+        del results[top_k:]
     
     return results
 
@@ -194,46 +434,173 @@ def search_description_index(features: np.ndarray, top_k: int) -> List[tuple]:
     
     Returns: List of (entity_id, similarity) tuples
     """
-    if description_index is None or description_index.ntotal == 0:
+    if description_index is None or description_index.ntotal + len(description_pending) == 0:
         return []
     
-    features = features.reshape(1, -1).astype('float32')
-    k = min(top_k, description_index.ntotal)
+    features = _normalize_rows(features)
+    results = description_pending.search(features, top_k)
     
-    similarities, indices = description_index.search(features, k)
+    if description_index.ntotal > 0:
+        k = min(top_k, description_index.ntotal)
+        similarities, indices = _flat_search(description_index, features, k)
+        
+        # Drop FAISS padding (-1) and gather entity ids in one vectorized step
+        valid = (indices[0] >= 0) & (indices[0] < len(description_id_map))
+        entity_ids = description_id_map.ids[indices[0][valid]]
+        sims = similarities[0][valid]
+        results += zip(entity_ids.tolist(), sims.tolist())
     
-    results = []
-    for sim, idx in zip(similarities[0], indices[0]):
-        if idx >= 0 and idx < len(description_id_map):
-            entity_id = description_id_map[idx]
-            results.append((entity_id, float(sim)))
+    if len(description_pending):
+        # Merge indexed and pending hits
+        results.sort(key=lambda r: r[1], reverse=True)
+        del results[top_k:]
     
     return results
 
 
 def add_to_visual_index(entity_id: str, features: np.ndarray):
-    """Add features to visual index."""
-    global visual_index, visual_id_map
-    
-    features = features.reshape(1, -1).astype('float32')
-    visual_index.add(features)
-    visual_id_map.append(entity_id)
+    """Queue features for the visual index (bulk-added by flush_pending)."""
+    visual_pending.append(entity_id, _normalize_rows(features)[0])
+    if len(visual_pending) >= MAX_PENDING:
+        visual_pending.flush_into(visual_index, visual_id_map)
 
 
 def add_to_description_index(entity_id: str, features: np.ndarray):
-    """Add features to description index."""
-    global description_index, description_id_map
+    """Queue features for the description index (bulk-added by flush_pending)."""
+    description_pending.append(entity_id, _normalize_rows(features)[0])
+    if len(description_pending) >= MAX_PENDING:
+        description_pending.flush_into(description_index, description_id_map)
+
+
+def flush_pending():
+    """Bulk-add all pending vectors to their FAISS indices. Caller must hold the lock."""
+    visual_pending.flush_into(visual_index, visual_id_map)
+    description_pending.flush_into(description_index, description_id_map)
+
+
+def refresh_indexed_features(entity: SharedMemoryEntity):
+    """Overwrite an entity's stored vectors in place after its features were aggregated."""
+    for index, id_map, pending, features in (
+        (visual_index, visual_id_map, visual_pending, entity.visual_features),
+        (description_index, description_id_map, description_pending, entity.description_embedding),
+    ):
+        if features is None:
+            continue
+        position = id_map.positions.get(entity.entity_id)
+        if position is not None:
+            _stored_vectors(index)[position] = _normalize_rows(features)[0]
+        elif entity.entity_id in pending.positions:
+            pending.vectors[pending.positions[entity.entity_id]] = _normalize_rows(features)[0]
+
+
+def mark_dirty():
+    """Flag that memory changed since the last snapshot."""
+    global _snapshot_dirty
+    _snapshot_dirty = True
+
+
+def save_snapshot(snapshot_dir: str):
+    """
+    Write both FAISS indices, their id maps and all entities to snapshot_dir.
+    
+    Files are written under temporary names and renamed, so a crash mid-write
+    never leaves a half-written snapshot behind.
+    """
+    global _snapshot_dirty
+    
+    path = Path(snapshot_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    
+    with lock:
+        flush_pending()
+        state = {
+            "entities": [e.to_dict() for e in entities.values()],
+            "visual_ids": visual_id_map.ids[:len(visual_id_map)].tolist(),
+            "description_ids": description_id_map.ids[:len(description_id_map)].tolist(),
+        }
+        faiss.write_index(visual_index, str(path / "visual.faiss.tmp"))
+        faiss.write_index(description_index, str(path / "description.faiss.tmp"))
+        with open(path / "state.json.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        _snapshot_dirty = False
+    
+    for name in ("visual.faiss", "description.faiss", "state.json"):
+        os.replace(path / f"{name}.tmp", path / name)
+
+
+def load_snapshot(snapshot_dir: str) -> bool:
+    """
+    Restore indices, id maps and entities from snapshot_dir.
+    
+    Returns:
+        True if a snapshot was found and loaded
+    """
+    global visual_index, description_index
+    
+    path = Path(snapshot_dir)
+    if not all((path / name).exists() for name in ("visual.faiss", "description.faiss", "state.json")):
+        return False
     
-    features = features.reshape(1, -1).astype('float32')
-    description_index.add(features)
-    description_id_map.append(entity_id)
+    with open(path / "state.json", "r", encoding="utf-8") as f:
+        state = json.load(f)
+    
+    with lock:
+        # Indices stay writable (no IO_FLAG_MMAP): new entities are appended and
+        # revisits overwrite stored vectors in place
+        visual_index = faiss.read_index(str(path / "visual.faiss"))
+        description_index = faiss.read_index(str(path / "description.faiss"))
+        
+        for entity_id in state["visual_ids"]:
+            visual_id_map.append(entity_id)
+        for entity_id in state["description_ids"]:
+            description_id_map.append(entity_id)
+        
+        for data in state["entities"]:
+            entity = SharedMemoryEntity.from_dict(data)
+            if entity.visual_features is not None:
+                entity.visual_features = entity.visual_features.astype(np.float32)
+            if entity.description_embedding is not None:
+                entity.description_embedding = entity.description_embedding.astype(np.float32)
+            register_entity(entity)
+    
+    print(f"[SharedMemory] Loaded snapshot from {path}: {len(entities)} entities")
+    return True
+
+
+async def flush_loop():
+    """Flush pending index adds every FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        if len(visual_pending) or len(description_pending):
+            with lock:
+                flush_pending()
+
+
+async def snapshot_loop():
+    """Save a snapshot every SNAPSHOT_INTERVAL seconds when memory changed."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        if _snapshot_dirty:
+            await asyncio.to_thread(save_snapshot, SNAPSHOT_DIR)
 
 
 # ========== API Endpoints ==========
 @app.on_event("startup")
 async def startup_event():
-    """Initialize indices on server startup."""
+    """Initialize indices on server startup, restoring the last snapshot if configured."""
     initialize_indices()
+    asyncio.create_task(flush_loop())
+    
+    if SNAPSHOT_DIR:
+        load_snapshot(SNAPSHOT_DIR)
+        asyncio.create_task(snapshot_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write a final snapshot so no changes since the last interval are lost."""
+    if SNAPSHOT_DIR and _snapshot_dirty:
+        save_snapshot(SNAPSHOT_DIR)
 
 
 @app.get("/")
@@ -243,8 +610,8 @@ async def root():
         "status": "running",
         "service": "Shared Memory Server",
         "total_entities": len(entities),
-        "visual_index_size": visual_index.ntotal if visual_index else 0,
-        "description_index_size": description_index.ntotal if description_index else 0,
+        "visual_index_size": visual_index.ntotal + len(visual_pending) if visual_index else 0,
+        "description_index_size": description_index.ntotal + len(description_pending) if description_index else 0,
         "config": config.to_dict()
     }
 
@@ -276,7 +643,8 @@ async def search_entities(request: SearchRequest):
         
         # Combine results
         all_entity_ids = set(visual_results.keys()) | set(desc_results.keys())
-        combined_results = []
+        candidate_ids = []
+        candidate_scores = []
         
         for entity_id in all_entity_ids:
             visual_sim = visual_results.get(entity_id, 0.0)
@@ -287,42 +655,51 @@ async def search_entities(request: SearchRequest):
             visual_pass = visual_sim >= config.visual_similarity_threshold or not request.visual_features
             desc_pass = desc_sim >= config.description_similarity_threshold or not request.description_embedding
             
-            if visual_pass and desc_pass:
-                combined_score = compute_combined_score(visual_sim, desc_sim)
-                entity = entities.get(entity_id)
-                
-                if entity:
-                    combined_results.append({
-                        "entity_id": entity_id,
-                        "entity_type": entity.entity_type,
-                        "description_text": entity.description_text,
-                        "visual_similarity": visual_sim,
-                        "description_similarity": desc_sim,
-                        "combined_score": combined_score,
-                        "meta_info": {
-                            "created_at": entity.created_at,
-                            "last_updated": entity.last_updated,
-                            "exploration_priority": entity.exploration_priority,
-                            "visit_count": entity.visit_count
-                        },
-                        "inferred_properties": entity.inferred_properties
-                    })
+            if visual_pass and desc_pass and entity_id in entities:
+                candidate_ids.append(entity_id)
+                candidate_scores.append(compute_combined_score(visual_sim, desc_sim))
         
-        # Sort by combined score
-        combined_results.sort(key=lambda x: x["combined_score"], reverse=True)
+        # Select top-k by combined score (partial selection, then sort only the top-k)
+        scores = np.asarray(candidate_scores, dtype=np.float64)
+        k = min(request.top_k, len(scores))
+        if k > 0:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            top = np.empty(0, dtype=np.int64)
+        
+        combined_results = []
+        for i in top.tolist():
+            entity_id = candidate_ids[i]
+            entity = entities[entity_id]
+            combined_results.append({
+                "entity_id": entity_id,
+                "entity_type": entity.entity_type,
+                "description_text": entity.description_text,
+                "visual_similarity": visual_results.get(entity_id, 0.0),
+                "description_similarity": desc_results.get(entity_id, 0.0),
+                "combined_score": float(scores[i]),
+                "meta_info": {
+                    "created_at": entity.created_at,
+                    "last_updated": entity.last_updated,
+                    "exploration_priority": entity.exploration_priority,
+                    "visit_count": entity.visit_count
+                },
+                "inferred_properties": entity.inferred_properties
+            })
         
         # Determine match status
-        match_found = len(combined_results) > 0
+        match_found = len(candidate_ids) > 0
         is_same_object = False
         top_entity_id = None
         
         if match_found:
-            top_result = combined_results[0]
-            top_entity_id = top_result["entity_id"]
-            is_same_object = top_result["combined_score"] >= config.same_object_threshold
+            best = int(top[0]) if k > 0 else int(np.argmax(scores))
+            top_entity_id = candidate_ids[best]
+            is_same_object = float(scores[best]) >= config.same_object_threshold
         
         return SearchResponse(
-            results=[SearchResult(**r) for r in combined_results[:request.top_k]],
+            results=[SearchResult(**r) for r in combined_results],
             match_found=match_found,
             is_same_object=is_same_object,
             top_entity_id=top_entity_id
@@ -336,12 +713,12 @@ async def add_entity(request: AddEntityRequest):
         # Create visual features array if provided
         visual_features = None
         if request.visual_features:
-            visual_features = np.array(request.visual_features, dtype=np.float32)
+            visual_features = _normalize_rows(request.visual_features)[0]
         
         # Create description embedding array if provided
         description_embedding = None
         if request.description_embedding:
-            description_embedding = np.array(request.description_embedding, dtype=np.float32)
+            description_embedding = _normalize_rows(request.description_embedding)[0]
         
         # Create new entity
         entity = SharedMemoryEntity.create_new(
@@ -357,7 +734,8 @@ async def add_entity(request: AddEntityRequest):
         )
         
         # Store entity
-        entities[entity.entity_id] = entity
+        register_entity(entity)
+        mark_dirty()
         
         # Add to FAISS indices
         if visual_features is not None:
@@ -385,11 +763,11 @@ async def update_entity(request: UpdateEntityRequest):
         # Prepare new features
         new_visual = None
         if request.new_visual_features:
-            new_visual = np.array(request.new_visual_features, dtype=np.float32)
+            new_visual = _normalize_rows(request.new_visual_features)[0]
         
         new_desc = None
         if request.new_description_embedding:
-            new_desc = np.array(request.new_description_embedding, dtype=np.float32)
+            new_desc = _normalize_rows(request.new_description_embedding)[0]
         
         # Update entity
         entity.update_on_revisit(
@@ -399,6 +777,10 @@ async def update_entity(request: UpdateEntityRequest):
             new_description_embedding=new_desc,
             feature_aggregation_weight=config.feature_aggregation_weight
         )
+        refresh_indexed_features(entity)
+        touch_recency(entity)
+        agent_to_entities[request.agent_id].add(entity.entity_id)
+        mark_dirty()
         
         print(f"[SharedMemory] Updated entity {entity.entity_id} by {request.agent_id}, visit_count={entity.visit_count}")
         
@@ -425,14 +807,12 @@ async def get_entity(request: GetEntityRequest):
 async def list_entities(limit: int = 100, offset: int = 0):
     """List all entities (paginated)."""
     with lock:
-        entity_list = list(entities.values())
-        total = len(entity_list)
+        total = len(recency)
         
-        # Sort by last_updated (most recent first)
-        entity_list.sort(key=lambda e: e.last_updated, reverse=True)
-        
-        # Paginate
-        paginated = entity_list[offset:offset + limit]
+        # Paginate from the newest end of the recency index (most recent first)
+        start = max(total - offset - limit, 0)
+        end = max(total - offset, 0)
+        paginated = [entities[entity_id] for _, _, entity_id in reversed(recency[start:end])]
         
         return {
             "total": total,
@@ -447,9 +827,8 @@ async def get_entities_by_agent(agent_id: str):
     """Get all entities discovered by a specific agent."""
     with lock:
         agent_entities = [
-            e.get_meta_and_properties()
-            for e in entities.values()
-            if agent_id in e.inferred_properties.get("discovered_by_agents", [])
+            entities[entity_id].get_meta_and_properties()
+            for entity_id in agent_to_entities.get(agent_id, ())
         ]
         
         return {
@@ -494,9 +873,16 @@ async def reset_memory():
     
     with lock:
         entities.clear()
+        recency.clear()
+        recency_keys.clear()
+        agent_to_entities.clear()
+        type_counts.clear()
         visual_id_map.clear()
         description_id_map.clear()
+        visual_pending.clear()
+        description_pending.clear()
         initialize_indices()
+        mark_dirty()
         
         return {"status": "reset", "message": "All memory cleared"}
 
@@ -505,39 +891,35 @@ async def reset_memory():
 async def get_stats():
     """Get memory statistics."""
     with lock:
-        # Calculate entity type distribution
-        type_counts = {}
-        for entity in entities.values():
-            t = entity.entity_type
-            type_counts[t] = type_counts.get(t, 0) + 1
-        
-        # Calculate agent discovery stats
-        agent_counts = {}
-        for entity in entities.values():
-            for agent in entity.inferred_properties.get("discovered_by_agents", []):
-                agent_counts[agent] = agent_counts.get(agent, 0) + 1
-        
         return {
             "total_entities": len(entities),
-            "visual_index_size": visual_index.ntotal if visual_index else 0,
-            "description_index_size": description_index.ntotal if description_index else 0,
-            "entity_types": type_counts,
-            "discoveries_by_agent": agent_counts,
+            "visual_index_size": visual_index.ntotal + len(visual_pending) if visual_index else 0,
+            "description_index_size": description_index.ntotal + len(description_pending) if description_index else 0,
+            "entity_types": dict(type_counts),
+            "discoveries_by_agent": {agent: len(ids) for agent, ids in agent_to_entities.items()},
             "config": config.to_dict()
         }
 
 
 if __name__ == "__main__":
     import uvicorn
-    import os
     
     # Priority: environment variable > config file > default
     host = os.getenv("HOST", config.server_host)
     port = int(os.getenv("SHARED_MEMORY_PORT", str(config.server_port)))
+    # Entities and FAISS indices live in process memory, so each worker holds its
+    # own copy. Keep the default at 1; more workers only suit read-mostly replicas.
+    workers = int(os.getenv("SHARED_MEMORY_WORKERS", "1"))
     
     print(f"Starting Shared Memory Server on {host}:{port}")
     print(f"API docs available at http://{host}:{port}/docs")
     print(f"Configuration: {config.to_dict()}")
     
-    uvicorn.run(app, host=host, port=port)
+    if workers > 1:
+        print(f"Warning: running {workers} workers, memory state is NOT shared between them")
+        # Multiple workers require an import string instead of the app object
+        uvicorn.run("shared_memory_server:app", host=host, port=port, workers=workers)
+    else:
+        # loop/http "auto" pick uvloop and httptools when installed (uvicorn[standard])
+        uvicorn.run(app, host=host, port=port, loop="auto", http="auto")
 
@@ -2,7 +2,27 @@
 测试工具函数
 运行此脚本确保所有依赖正确安装
 """
+import importlib
+import importlib.util
 import os
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import SkipTest
+
+from utils.environment import create_environment, get_visible_objects, execute_action
+from utils.embedding import get_embedding
+from utils.call_llm import call_llm, call_llm_multi
+
+# The module itself (utils.call_llm is shadowed by the function re-exported from utils)
+call_llm_module = importlib.import_module("utils.call_llm")
+
+# Optional dependencies: checked once instead of catching ImportError per test
+_HAVE_FAISS = importlib.util.find_spec("faiss") is not None
+_HAVE_SENTENCE_TRANSFORMERS = importlib.util.find_spec("sentence_transformers") is not None
+
+if _HAVE_FAISS:
+    from utils.memory import create_memory, add_to_memory, search_memory
+
 
 def test_environment():
     """测试环境模拟"""
@@ -10,8 +30,6 @@ def test_environment():
     print("Testing Environment Simulation")
     print("="*60)
     
-    from utils.environment import create_environment, get_visible_objects, execute_action
-    
     env = create_environment(num_positions=5)
     print(f"✓ Environment created with {env['num_positions']} positions")
     
@@ -23,13 +41,28 @@ def test_environment():
     print(f"✓ Agent moved to position: {new_pos}")
 
 
+def test_environment_duplicate_pool():
+    """测试重复物体名 (每个物体名只占一个掩码位)"""
+    # Layouts are random: repeat so both visit orders meet every layout
+    for trial in range(200):
+        env = create_environment(num_positions=2, object_pool=["a", "a", "b"])
+        first = trial % 2
+        env["agent_positions"]["test_agent"] = first
+        execute_action("test_agent", "stay", env)  # record the start position
+        execute_action("test_agent", "backward" if first else "forward", env)
+        assert env["explored_by_all"] == set(env["objects"][0]) | set(env["objects"][1]), env["objects"]
+    print("✓ Every visited object recorded with duplicate pool names")
+
+
 def test_embedding():
     """测试embedding"""
     print("\n" + "="*60)
     print("Testing Embedding")
     print("="*60)
     
-    from utils.embedding import get_embedding
+    if not _HAVE_SENTENCE_TRANSFORMERS and not os.getenv("DISABLE_EMBEDDING"):
+        print("  Run: pip install sentence-transformers (or set DISABLE_EMBEDDING=1)")
+        raise SkipTest("sentence-transformers not installed")
     
     text = "This is a test sentence"
     emb = get_embedding(text)
@@ -43,8 +76,12 @@ def test_memory():
     print("Testing FAISS Memory")
     print("="*60)
     
-    from utils.memory import create_memory, add_to_memory, search_memory
-    from utils.embedding import get_embedding
+    if not _HAVE_FAISS:
+        print("  Run: pip install faiss-cpu")
+        raise SkipTest("faiss not installed")
+    if not _HAVE_SENTENCE_TRANSFORMERS and not os.getenv("DISABLE_EMBEDDING"):
+        print("  Run: pip install sentence-transformers (or set DISABLE_EMBEDDING=1)")
+        raise SkipTest("sentence-transformers not installed")
     
     index = create_memory(dimension=384)
     memory_texts = []
@@ -53,7 +90,7 @@ def test_memory():
     texts = ["I saw a chair", "I saw a table", "I saw a lamp"]
     for text in texts:
         emb = get_embedding(text)
-        add_to_memory(index, emb, text, memory_texts)
+        index = add_to_memory(index, emb, text, memory_texts)
     
     print(f"✓ Added {index.ntotal} memories")
     
@@ -63,8 +100,8 @@ def test_memory():
     results = search_memory(index, query_emb, memory_texts, top_k=2)
     
     print(f"✓ Search results for '{query}':")
-    for text, dist in results:
-        print(f"  - {text} (distance: {dist:.3f})")
+    for text, sim in results:
+        print(f"  - {text} (similarity: {sim:.3f})")
 
 
 def test_llm():
@@ -74,18 +111,102 @@ def test_llm():
     print("="*60)
     
     if not os.getenv("GEMINI_API_KEY"):
-        print("⚠ GEMINI_API_KEY not set, skipping LLM test")
         print("  Set it with: $env:GEMINI_API_KEY='your-key' (Windows)")
         print("  or: export GEMINI_API_KEY='your-key' (Linux/Mac)")
-        return
-    
-    from utils.call_llm import call_llm
+        raise SkipTest("GEMINI_API_KEY not set")
     
     prompt = "Say 'Hello, PocketFlow!' in one sentence."
     response = call_llm(prompt)
     print(f"✓ LLM response: {response[:100]}...")
 
 
+@contextmanager
+def _stubbed_llm(sync_completions, async_completions=None):
+    """Route call_llm/acall_llm to stub clients (no API key, no persistent cache)"""
+    stubs = {
+        "_defaults": lambda: {"api_key": "test", "model": "stub", "base_url": None,
+                              "organization": None, "semantic_cache_threshold": None},
+        "_get_client": lambda *a: SimpleNamespace(chat=SimpleNamespace(completions=sync_completions)),
+        "_get_async_client": lambda *a: SimpleNamespace(chat=SimpleNamespace(completions=async_completions)),
+        "_get_cache_shelf": lambda: None,
+        "_semantic_threshold": lambda: None,
+    }
+    saved = {name: getattr(call_llm_module, name) for name in stubs}
+    try:
+        for name, stub in stubs.items():
+            setattr(call_llm_module, name, stub)
+        yield
+    finally:
+        for name, original in saved.items():
+            setattr(call_llm_module, name, original)
+
+
+def test_llm_cache_truncated():
+    """测试截断的回复不会被普通调用从缓存读到"""
+    full = "```yaml\naction: forward\n```\nreasoning that follows the yaml block"
+    
+    class Stream:
+        def __init__(self, text):
+            cut = text.index("```", 3) + 3  # end of the yaml block
+            self.chunks = [text[:cut], text[cut:]]
+        
+        def __iter__(self):
+            for piece in self.chunks:
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+        
+        def close(self):
+            pass
+    
+    class SyncCompletions:
+        def create(self, **kwargs):
+            if kwargs["stream"]:
+                return Stream(full)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=full))])
+    
+    prompt = f"cache truncation check {os.getpid()}"
+    with _stubbed_llm(SyncCompletions()):
+        truncated = call_llm(prompt, stop_after_yaml=True)
+        plain = call_llm(prompt)
+        short = call_llm(prompt, max_tokens=5)
+    
+    assert truncated == "```yaml\naction: forward\n```", truncated
+    assert plain == full, plain
+    assert short == full  # the stub ignores max_tokens; the point is a separate cache slot
+    print("✓ Truncated responses are cached separately from full ones")
+
+
+def test_llm_multi_fallback():
+    """测试call_llm_multi回退路径 (stubbed client, no API key needed)"""
+    print("\n" + "="*60)
+    print("Testing LLM Multi-Prompt Fallback")
+    print("="*60)
+    
+    requests_seen = []
+    
+    def reply(text):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+    
+    class SyncCompletions:
+        def create(self, **kwargs):
+            requests_seen.append(kwargs)
+            return reply("one answer without any agent headers")
+    
+    class AsyncCompletions:
+        async def create(self, **kwargs):
+            requests_seen.append(kwargs)
+            if kwargs["stream"]:
+                raise AssertionError("stubbed fallback does not stream")
+            return reply(f"answer to {kwargs['messages'][0]['content']}")
+    
+    with _stubbed_llm(SyncCompletions(), AsyncCompletions()):
+        responses = call_llm_multi(["p1", "p2"], max_tokens=50, use_cache=False)
+    
+    assert responses == ["answer to p1", "answer to p2"], responses
+    # One combined request, then one per prompt, all with the caller's max_tokens
+    assert len(requests_seen) == 3 and all(r["max_tokens"] == 50 for r in requests_seen)
+    print(f"✓ Fallback responses: {responses}")
+
+
 if __name__ == "__main__":
     print("\n" + "="*60)
     print("UTILITY FUNCTIONS TEST SUITE")
@@ -97,23 +218,45 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"\n✗ Environment test failed: {e}")
     
+    try:
+        test_environment_duplicate_pool()
+        print("\n✓ Duplicate object pool test passed!")
+    except Exception as e:
+        print(f"\n✗ Duplicate object pool test failed: {e}")
+    
     try:
         test_embedding()
         print("\n✓ Embedding test passed!")
+    except SkipTest as e:
+        print(f"\n⚠ test_embedding skipped: {e}")
     except Exception as e:
         print(f"\n✗ Embedding test failed: {e}")
-        print("  Run: pip install sentence-transformers")
     
     try:
         test_memory()
         print("\n✓ Memory test passed!")
+    except SkipTest as e:
+        print(f"\n⚠ test_memory skipped: {e}")
     except Exception as e:
         print(f"\n✗ Memory test failed: {e}")
-        print("  Run: pip install faiss-cpu")
+    
+    try:
+        test_llm_cache_truncated()
+        print("\n✓ LLM cache truncation test passed!")
+    except Exception as e:
+        print(f"\n✗ LLM cache truncation test failed: {e}")
+    
+    try:
+        test_llm_multi_fallback()
+        print("\n✓ LLM multi-prompt fallback test passed!")
+    except Exception as e:
+        print(f"\n✗ LLM multi-prompt fallback test failed: {e}")
     
     try:
         test_llm()
         print("\n✓ LLM test passed!")
+    except SkipTest as e:
+        print(f"\n⚠ test_llm skipped: {e}")
     except Exception as e:
         print(f"\n✗ LLM test failed: {e}")
         print("  Make sure GEMINI_API_KEY is set")
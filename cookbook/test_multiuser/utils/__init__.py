@@ -1,30 +1,36 @@
 """
 Utility functions for multi-agent exploration
 """
-from .call_llm import call_llm
-from .embedding import get_embedding, get_embeddings_batch
+from .call_llm import call_llm, acall_llm, call_llm_batch, call_llm_multi
+from .embedding import get_embedding, get_embeddings_batch, cosine_similarity
 from .environment import (
     create_environment,
     add_message,
-    get_messages_for
+    get_messages_for,
+    Message
 )
 from .perception_interface import (
     PerceptionInterface,
     MockPerception,
     XRPerception,
-    create_perception
+    create_perception,
+    register_perception
 )
 from .config_loader import (
     load_config,
     get_config_value,
     sync_unity_config
 )
+from .similarity import cosine, cosine_many, topk, quantize_i8, dequantize_i8, cosine_i8
 # Shared memory system
 from .clip_features import (
     extract_visual_features,
     extract_visual_features_batch,
     compute_visual_similarity,
-    get_clip_dimension
+    compute_visual_similarity_batch,
+    get_clip_dimension,
+    quantize_features,
+    dequantize_features
 )
 from .shared_memory_client import (
     SharedMemoryClient,
@@ -40,23 +46,38 @@ from .shared_memory_types import (
 
 __all__ = [
     'call_llm',
+    'acall_llm',
+    'call_llm_batch',
+    'call_llm_multi',
     'get_embedding',
     'get_embeddings_batch',
+    'cosine_similarity',
     'create_environment',
     'add_message',
     'get_messages_for',
+    'Message',
     'PerceptionInterface',
     'MockPerception',
     'XRPerception',
     'create_perception',
+    'register_perception',
     'load_config',
     'get_config_value',
     'sync_unity_config',
+    'cosine',
+    'cosine_many',
+    'topk',
+    'quantize_i8',
+    'dequantize_i8',
+    'cosine_i8',
     # Shared memory system
     'extract_visual_features',
     'extract_visual_features_batch',
     'compute_visual_similarity',
+    'compute_visual_similarity_batch',
     'get_clip_dimension',
+    'quantize_features',
+    'dequantize_features',
     'SharedMemoryClient',
     'get_shared_memory_client',
     'search_and_update_or_add',
@@ -2,22 +2,186 @@
 LLM utility - OpenAI Chat Completions API
 Supports custom operator base URL and API key via parameters or env vars.
 """
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any, Optional
+import re
+import shelve
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
 
 try:
     # openai>=1.0 modern client
-    from openai import OpenAI  # type: ignore
+    from openai import OpenAI, AsyncOpenAI  # type: ignore
 except Exception:  # pragma: no cover
     OpenAI = None  # fallback for environments without openai installed
+    AsyncOpenAI = None
 
 try:
-    from .config_loader import get_config_value
+    from .config_loader import get_config_value, load_config
 except ImportError:
     # Fallback if import fails
     def get_config_value(key: str, default: Any = None) -> Any:
         return default
 
+    def load_config() -> Dict[str, Any]:
+        return {}
+
+
+# Credentials/model resolved from config.json and the environment (see _defaults),
+# re-resolved only when load_config returns a freshly parsed config
+_DEFAULTS: Optional[Dict[str, Any]] = None
+_DEFAULTS_SOURCE: Optional[Dict[str, Any]] = None
+
+# Sync clients keyed by (api_key, base_url, organization) so connections are reused
+_CLIENTS: Dict[tuple, Any] = {}
+
+# Async client, built lazily and reused across acall_llm calls
+_async_client = None
+_async_client_key = None
+
+# Response cache (only deterministic temperature == 0 calls are cached):
+#   - exact: LRU keyed by sha256 of (model, base_url, temperature, prompt) plus
+#     any output-truncating options (stop_after_yaml, max_tokens), optionally persisted to a shelve file (llm.cache_path / LLM_CACHE_PATH)
+#   - semantic: opt-in, returns a stored response when the prompt embedding has
+#     cosine >= llm.semantic_cache_threshold / LLM_SEMANTIC_CACHE_THRESHOLD
+CACHE_MAX_SIZE = 4096
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_shelf = None
+_semantic_cache: Dict[tuple, Tuple[List[np.ndarray], List[str]]] = {}
+
+
+def _get_client(api_key: str, base_url: Optional[str], organization: Optional[str]):
+    """Return a cached OpenAI client for these credentials."""
+    key = (api_key, base_url, organization)
+    client = _CLIENTS.get(key)
+    if client is None:
+        if OpenAI is None:
+            raise RuntimeError("openai package not installed. Please `pip install openai`.")
+        client = _CLIENTS[key] = OpenAI(api_key=api_key, base_url=base_url, organization=organization)
+    return client
+
+
+def _defaults() -> Dict[str, Any]:
+    """Resolve default settings once per config load; priority is config.json, then environment."""
+    global _DEFAULTS, _DEFAULTS_SOURCE
+    config = load_config()
+    if _DEFAULTS is None or config is not _DEFAULTS_SOURCE:
+        _DEFAULTS_SOURCE = config
+        threshold = get_config_value("llm.semantic_cache_threshold") or os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD")
+        _DEFAULTS = {
+            "api_key": get_config_value("llm.api_key") or os.getenv("OPENAI_API_KEY", ""),
+            "model": get_config_value("llm.model") or os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            "base_url": get_config_value("llm.base_url") or os.getenv("OPENAI_BASE_URL"),
+            "organization": os.getenv("OPENAI_ORG"),
+            "semantic_cache_threshold": float(threshold) if threshold else None,
+        }
+    return _DEFAULTS
+
+
+def _cache_variant(stop_after_yaml: bool, max_tokens: Optional[int]) -> Tuple:
+    """Options that can cut a response short; they must not share cache entries with full responses."""
+    return (("stop_after_yaml",) if stop_after_yaml else ()) + ((("max_tokens", max_tokens),) if max_tokens else ())
+
+
+def _cache_key(model: str, base_url: Optional[str], temperature: float, prompt: str, variant: Tuple = ()) -> str:
+    # Plain calls keep the original key format, so persisted entries stay valid
+    suffix = f"\0{variant!r}" if variant else ""
+    return hashlib.sha256(f"{model}\0{base_url}\0{temperature}\0{prompt}{suffix}".encode("utf-8")).hexdigest()
+
+
+def _get_cache_shelf():
+    """Open the persistent cache file once, if one is configured."""
+    global _cache_shelf
+    if _cache_shelf is None:
+        path = get_config_value("llm.cache_path") or os.getenv("LLM_CACHE_PATH")
+        _cache_shelf = shelve.open(path) if path else False
+    return _cache_shelf
+
+
+def _semantic_threshold() -> Optional[float]:
+    return _defaults()["semantic_cache_threshold"]
+
+
+def _prompt_embedding(prompt: str) -> np.ndarray:
+    from .embedding import get_embedding  # lazy: only needed when semantic cache is on
+    vec = np.asarray(get_embedding(prompt), dtype=np.float32)
+    return vec / (np.linalg.norm(vec) + 1e-12)
+
+
+def _cache_lookup(model: str, base_url: Optional[str], temperature: float, prompt: str, variant: Tuple = ()) -> Optional[str]:
+    """Return a cached response for this call, or None on a miss."""
+    key = _cache_key(model, base_url, temperature, prompt, variant)
+    if key in _response_cache:
+        _response_cache.move_to_end(key)
+        return _response_cache[key]
+
+    shelf = _get_cache_shelf()
+    if shelf and key in shelf:
+        text = _response_cache[key] = shelf[key]
+        return text
+
+    threshold = _semantic_threshold()
+    entries = _semantic_cache.get((model, base_url, temperature, variant))
+    if threshold is not None and entries and entries[0]:
+        sims = np.vstack(entries[0]) @ _prompt_embedding(prompt)
+        best = int(np.argmax(sims))
+        if sims[best] >= threshold:
+            return entries[1][best]
+    return None
+
+
+def _cache_store(model: str, base_url: Optional[str], temperature: float, prompt: str, text: str, variant: Tuple = ()):
+    key = _cache_key(model, base_url, temperature, prompt, variant)
+    _response_cache[key] = text
+    if len(_response_cache) > CACHE_MAX_SIZE:
+        _response_cache.popitem(last=False)
+
+    shelf = _get_cache_shelf()
+    if shelf:
+        shelf[key] = text
+
+    if _semantic_threshold() is not None:
+        vectors, texts = _semantic_cache.setdefault((model, base_url, temperature, variant), ([], []))
+        vectors.append(_prompt_embedding(prompt))
+        texts.append(text)
+        if len(texts) > CACHE_MAX_SIZE:
+            del vectors[0], texts[0]
+
+
+def _read_until_yaml_end(stream) -> str:
+    """Accumulate streamed chunks, closing the stream once a ```yaml block ends."""
+    text = ""
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            text += chunk.choices[0].delta.content or ""
+            start = text.find("```yaml")
+            if start != -1 and text.find("```", start + 7) != -1:
+                break
+    finally:
+        stream.close()
+    return text
+
+
+async def _aread_until_yaml_end(stream) -> str:
+    """Async variant of _read_until_yaml_end."""
+    text = ""
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            text += chunk.choices[0].delta.content or ""
+            start = text.find("```yaml")
+            if start != -1 and text.find("```", start + 7) != -1:
+                break
+    finally:
+        await stream.close()
+    return text
+
 
 def call_llm(
     prompt: str,
@@ -25,6 +189,9 @@ def call_llm(
     base_url: Optional[str] = None,
     model: Optional[str] = None,
     temperature: float = 0.0,
+    use_cache: bool = True,
+    stop_after_yaml: bool = False,
+    max_tokens: Optional[int] = None,
 ) -> str:
     """
     Call OpenAI-compatible LLM and return the text response.
@@ -35,33 +202,182 @@ def call_llm(
         base_url: override base URL (falls back to config.json, then OPENAI_BASE_URL)
         model: override model name (falls back to config.json, then OPENAI_MODEL)
         temperature: sampling temperature (default 0.0)
+        use_cache: reuse cached responses for temperature 0 calls (default True)
+        stop_after_yaml: stream the response and stop as soon as the first
+            ```yaml block is closed (the rest is never read)
+        max_tokens: optional completion token limit
     """
     # Priority: parameter > config file > environment variable
-    api_key = api_key or get_config_value("llm.api_key") or os.getenv("OPENAI_API_KEY", "")
+    defaults = _defaults()
+    api_key = api_key or defaults["api_key"]
     if not api_key:
         raise RuntimeError("API key is not set in parameters, config.json, or OPENAI_API_KEY environment variable")
 
-    model = model or get_config_value("llm.model") or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    base_url = base_url or get_config_value("llm.base_url") or os.getenv("OPENAI_BASE_URL")
-    organization = os.getenv("OPENAI_ORG")
+    model = model or defaults["model"]
+    base_url = base_url or defaults["base_url"]
+    organization = defaults["organization"]
 
-    if OpenAI is None:
-        raise RuntimeError("openai package not installed. Please `pip install openai`.")
+    use_cache = use_cache and temperature == 0
+    variant = _cache_variant(stop_after_yaml, max_tokens)
+    if use_cache:
+        cached = _cache_lookup(model, base_url, temperature, prompt, variant)
+        if cached is not None:
+            return cached
 
     # base_url and organization are optional and may be None
-    client = OpenAI(api_key=api_key, base_url=base_url, organization=organization)
+    client = _get_client(api_key, base_url, organization)
+
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
 
     # Use chat.completions for a single-turn message
     resp = client.chat.completions.create(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=temperature,
+        stream=stop_after_yaml,
+        **extra,
     )
 
-    text = resp.choices[0].message.content or ""
+    text = _read_until_yaml_end(resp) if stop_after_yaml else resp.choices[0].message.content or ""
+    if use_cache:
+        _cache_store(model, base_url, temperature, prompt, text, variant)
     return text
 
 
+def _get_async_client(api_key: str, base_url: Optional[str], organization: Optional[str]):
+    """Return the shared AsyncOpenAI client, rebuilding it if the credentials changed."""
+    global _async_client, _async_client_key
+
+    if AsyncOpenAI is None:
+        raise RuntimeError("openai package not installed. Please `pip install openai`.")
+
+    key = (api_key, base_url, organization)
+    if _async_client is None or _async_client_key != key:
+        _async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, organization=organization)
+        _async_client_key = key
+    return _async_client
+
+
+async def acall_llm(
+    prompt: str,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: float = 0.0,
+    use_cache: bool = True,
+    stop_after_yaml: bool = False,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """
+    Async variant of call_llm; same arguments and config fallbacks.
+    """
+    defaults = _defaults()
+    api_key = api_key or defaults["api_key"]
+    if not api_key:
+        raise RuntimeError("API key is not set in parameters, config.json, or OPENAI_API_KEY environment variable")
+
+    model = model or defaults["model"]
+    base_url = base_url or defaults["base_url"]
+
+    use_cache = use_cache and temperature == 0
+    variant = _cache_variant(stop_after_yaml, max_tokens)
+    if use_cache:
+        cached = _cache_lookup(model, base_url, temperature, prompt, variant)
+        if cached is not None:
+            return cached
+
+    client = _get_async_client(api_key, base_url, defaults["organization"])
+
+    extra = {"max_tokens": max_tokens} if max_tokens else {}
+
+    resp = await client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=stop_after_yaml,
+        **extra,
+    )
+
+    text = await _aread_until_yaml_end(resp) if stop_after_yaml else resp.choices[0].message.content or ""
+    if use_cache:
+        _cache_store(model, base_url, temperature, prompt, text, variant)
+    return text
+
+
+def call_llm_batch(prompts: List[str], concurrency: int = 32, **kwargs) -> List[str]:
+    """
+    Call the LLM for several prompts concurrently.
+
+    Args:
+        prompts: input prompts
+        concurrency: maximum number of requests in flight
+        **kwargs: forwarded to acall_llm (api_key, base_url, model, temperature,
+            use_cache, stop_after_yaml, max_tokens)
+
+    Returns:
+        Responses in the same order as prompts
+    """
+    global _async_client
+
+    async def _gather() -> List[str]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(prompt: str) -> str:
+            async with semaphore:
+                return await acall_llm(prompt, **kwargs)
+
+        return await asyncio.gather(*(_one(p) for p in prompts))
+
+    try:
+        return asyncio.run(_gather())
+    finally:
+        # The client's connection pool is bound to the loop asyncio.run just closed
+        _async_client = None
+
+
+_AGENT_HEADER = re.compile(r"^=== AGENT (\d+) ===[ \t]*$", re.MULTILINE)
+
+
+def call_llm_multi(prompts: List[str], **kwargs) -> List[str]:
+    """
+    Answer several agents' prompts with a single LLM request.
+
+    The prompts are sent under "=== AGENT i ===" headers and the model is asked to
+    answer each under the same header. If the response cannot be split into one
+    answer per prompt, falls back to call_llm_batch (one request per prompt).
+
+    Args:
+        prompts: input prompts, one per agent
+        **kwargs: forwarded to call_llm / call_llm_batch
+
+    Returns:
+        Responses in the same order as prompts
+    """
+    if len(prompts) <= 1:
+        return [call_llm(p, **kwargs) for p in prompts]
+
+    sections = "\n\n".join(f"=== AGENT {i} ===\n{p}" for i, p in enumerate(prompts))
+    combined = (
+        f"Below are {len(prompts)} independent tasks, one per agent. Answer every task "
+        f"separately. Start each answer with its header line exactly as given "
+        f"(=== AGENT i ===) and follow that task's own output format.\n\n{sections}"
+    )
+    # stop_after_yaml would cut the combined reply off after the first agent's answer;
+    # it still applies to the per-prompt fallback
+    response = call_llm(combined, **{**kwargs, "stop_after_yaml": False})
+
+    answers: Dict[int, str] = {}
+    matches = list(_AGENT_HEADER.finditer(response))
+    for m, nxt in zip(matches, matches[1:] + [None]):
+        end = nxt.start() if nxt else len(response)
+        answers[int(m.group(1))] = response[m.end():end].strip()
+
+    if sorted(answers) != list(range(len(prompts))):
+        print(f"[LLM] Combined response had {len(answers)}/{len(prompts)} answers, retrying per prompt")
+        return call_llm_batch(prompts, **kwargs)
+    return [answers[i] for i in range(len(prompts))]
+
+
 if __name__ == "__main__":
     # Simple connectivity test
     test_prompt = (
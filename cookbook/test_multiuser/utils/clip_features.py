@@ -6,14 +6,84 @@ These features are used for visual similarity matching in the shared memory syst
 """
 import os
 import numpy as np
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Union, List
 import base64
+import threading
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from transformers import CLIPProcessor, CLIPModel
+except ImportError:
+    CLIPProcessor = CLIPModel = None
 
 # Global model instances (avoid repeated loading)
 _clip_model = None
 _clip_processor = None
 _clip_device = None
+_clip_dtype = None  # torch dtype of the real model's weights (fp16 on CUDA)
+_clip_lock = threading.Lock()
+
+# Threads used to decode images in extract_visual_features_batch
+LOAD_WORKERS = int(os.getenv("CLIP_LOAD_WORKERS", "8"))
+# Images whose shorter side falls in the same BUCKET_SIZE band share a forward pass
+BUCKET_SIZE = 64
+
+
+def _load_clip_model():
+    """Load the CLIP model; returns (model, processor, device, dtype)."""
+    if os.getenv("DISABLE_CLIP"):
+        print("[CLIP] CLIP disabled via environment variable, using fake model")
+        return _FakeCLIPModel(), None, "cpu", None
+    
+    try:
+        if torch is None or CLIPModel is None:
+            raise ImportError("torch and transformers are required for CLIP")
+        
+        # Use CLIP ViT-B/32 (512-dim features)
+        model_name = os.getenv("CLIP_MODEL", "openai/clip-vit-base-patch32")
+        print(f"[CLIP] Loading CLIP model: {model_name}")
+        
+        model = CLIPModel.from_pretrained(model_name)
+        processor = CLIPProcessor.from_pretrained(model_name)
+        
+        if os.getenv("CLIP_BACKEND", "torch").lower() == "onnx":
+            try:
+                model = _ONNXCLIPVisionModel(model, model_name)
+                print(f"[CLIP] Using ONNX Runtime backend: {model.path}")
+                return model, processor, "cpu", torch.float32
+            except Exception as e:
+                print(f"[CLIP] ONNX backend unavailable ({e}), using PyTorch")
+        
+        # Use GPU if available
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model = model.to(device)
+        if device == "cuda":
+            # Half precision halves memory traffic and uses tensor cores
+            model = model.half()
+        else:
+            # Leave cores for concurrently running agents
+            torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+        model.eval()
+        
+        print(f"[CLIP] Model loaded successfully on {device}")
+        return model, processor, device, next(model.parameters()).dtype
+        
+    except Exception as e:
+        print(f"[CLIP] Failed to load CLIP model: {e}")
+        print("[CLIP] Falling back to fake model")
+        return _FakeCLIPModel(), None, "cpu", None
 
 
 def get_clip_model():
@@ -21,68 +91,99 @@ def get_clip_model():
     Get or initialize CLIP model.
     
     Uses transformers library with CLIP ViT-B/32 model (512-dim output).
+    Set CLIP_BACKEND=onnx to run the vision tower through an INT8-quantized
+    onnxruntime session instead of PyTorch (CPU only).
     Falls back to fake model if DISABLE_CLIP env var is set or loading fails.
+    Thread-safe: concurrent first calls load the model only once.
     """
-    global _clip_model, _clip_processor, _clip_device
+    global _clip_model, _clip_processor, _clip_device, _clip_dtype
     
     if _clip_model is None:
-        if os.getenv("DISABLE_CLIP"):
-            print("[CLIP] CLIP disabled via environment variable, using fake model")
-            _clip_model = _FakeCLIPModel()
-            _clip_processor = None
-            _clip_device = "cpu"
-        else:
-            try:
-                import torch
-                from transformers import CLIPProcessor, CLIPModel
-                
-                # Use CLIP ViT-B/32 (512-dim features)
-                model_name = os.getenv("CLIP_MODEL", "openai/clip-vit-base-patch32")
-                print(f"[CLIP] Loading CLIP model: {model_name}")
-                
-                _clip_model = CLIPModel.from_pretrained(model_name)
-                _clip_processor = CLIPProcessor.from_pretrained(model_name)
-                
-                # Use GPU if available
-                _clip_device = "cuda" if torch.cuda.is_available() else "cpu"
-                _clip_model = _clip_model.to(_clip_device)
-                _clip_model.eval()
-                
-                print(f"[CLIP] Model loaded successfully on {_clip_device}")
-                
-            except Exception as e:
-                print(f"[CLIP] Failed to load CLIP model: {e}")
-                print("[CLIP] Falling back to fake model")
-                _clip_model = _FakeCLIPModel()
-                _clip_processor = None
-                _clip_device = "cpu"
+        with _clip_lock:
+            if _clip_model is None:
+                model, _clip_processor, _clip_device, _clip_dtype = _load_clip_model()
+                # Publish the model last so unlocked readers never see a partial load
+                _clip_model = model
     
     return _clip_model, _clip_processor, _clip_device
 
 
+class _ONNXCLIPVisionModel:
+    """
+    CLIP image encoder exported to ONNX and run with onnxruntime.
+    
+    The vision tower plus projection is exported once, dynamically quantized to
+    INT8 and cached under CLIP_ONNX_DIR (default ~/.cache/clip_onnx).
+    Exposes the same get_image_features(pixel_values=...) call as CLIPModel.
+    """
+    
+    def __init__(self, clip_model, model_name: str):
+        import onnxruntime as ort
+        
+        cache_dir = Path(os.getenv("CLIP_ONNX_DIR", Path.home() / ".cache" / "clip_onnx"))
+        self.path = cache_dir / f"{model_name.replace('/', '_')}_vision_int8.onnx"
+        if not self.path.exists():
+            self._export(clip_model, cache_dir)
+        
+        self.session = ort.InferenceSession(str(self.path), providers=["CPUExecutionProvider"])
+    
+    def _export(self, clip_model, cache_dir: Path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        
+        class _VisionTower(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+            
+            def forward(self, pixel_values):
+                return self.model.get_image_features(pixel_values=pixel_values)
+        
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        fp32_path = self.path.with_name(self.path.stem + "_fp32.onnx")
+        size = clip_model.config.vision_config.image_size
+        print(f"[CLIP] Exporting vision tower to ONNX: {fp32_path}")
+        torch.onnx.export(
+            _VisionTower(clip_model.eval()),
+            torch.zeros(1, 3, size, size),
+            str(fp32_path),
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+        )
+        quantize_dynamic(str(fp32_path), str(self.path), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+    
+    def get_image_features(self, pixel_values=None, **kwargs):
+        features = self.session.run(None, {"pixel_values": pixel_values.cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(features)
+    
+    def to(self, device):
+        return self
+    
+    def eval(self):
+        return self
+
+
 class _FakeCLIPModel:
     """Fake CLIP model for testing when real model is unavailable."""
     
     def __init__(self, dimension: int = 512):
         self.dimension = dimension
+        # Shared base vector, modulated per image in get_image_features
+        self._base = np.random.default_rng(0).standard_normal(dimension).astype(np.float32)
+        self._phases = np.arange(dimension, dtype=np.float32)
     
     def get_image_features(self, **kwargs):
         """Return deterministic fake features based on pixel values."""
-        import torch
         pixel_values = kwargs.get("pixel_values")
         if pixel_values is not None:
-            # Use pixel values to generate deterministic features
-            batch_size = pixel_values.shape[0]
-            # Create hash-based features
-            features = []
-            for i in range(batch_size):
-                # Use mean of pixel values as seed for reproducibility
-                seed = int(abs(pixel_values[i].mean().item()) * 1e6) % (2**32)
-                rng = np.random.default_rng(seed)
-                vec = rng.standard_normal(self.dimension).astype(np.float32)
-                vec = vec / (np.linalg.norm(vec) + 1e-12)
-                features.append(vec)
-            return torch.tensor(np.stack(features))
+            # Use mean of pixel values as seed for reproducibility
+            seeds = (np.abs(pixel_values.mean(dim=(1, 2, 3)).numpy()) * 1e6).astype(np.uint32)
+            # Hash-style mixing of each seed into the base vector, whole batch at once
+            features = self._base * np.sin(seeds[:, None].astype(np.float32) * 0.001 + self._phases)
+            features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-12
+            return torch.from_numpy(features)
         return torch.zeros(1, self.dimension)
     
     def to(self, device):
@@ -92,9 +193,35 @@ class _FakeCLIPModel:
         return self
 
 
+def _fake_pixel_values(images: list):
+    """Stack images into one (B, 3, 224, 224) float tensor for the fake model."""
+    batch = np.stack([np.asarray(img.resize((224, 224)), dtype=np.float32) for img in images])
+    batch *= 1.0 / 255.0
+    return torch.from_numpy(batch).permute(0, 3, 1, 2)
+
+
+def quantize_features(features: np.ndarray) -> np.ndarray:
+    """
+    Scalar-quantize L2-normalized features to signed INT8 (value * 127).
+    
+    Args:
+        features: Normalized feature vector(s), components in [-1, 1]
+    
+    Returns:
+        int8 array of the same shape (4x smaller than float32)
+    """
+    return np.clip(np.rint(features * 127.0), -127, 127).astype(np.int8)
+
+
+def dequantize_features(q: np.ndarray) -> np.ndarray:
+    """Inverse of quantize_features: map INT8 codes back to float32 in [-1, 1]."""
+    return q.astype(np.float32) * (1.0 / 127.0)
+
+
 def extract_visual_features(
     image_path: str,
-    normalize: bool = True
+    normalize: bool = True,
+    dtype: str = "float32"
 ) -> Optional[np.ndarray]:
     """
     Extract visual features from an image using CLIP.
@@ -102,52 +229,65 @@ def extract_visual_features(
     Args:
         image_path: Path to the image file
         normalize: Whether to L2-normalize the features (default True)
+        dtype: "float32" (default) or "int8" for scalar-quantized output
+               (see quantize_features; requires normalize=True)
     
     Returns:
-        Feature vector (512 dimensions by default) or None if extraction fails
+        Feature vector (512 dimensions by default) or None if extraction fails.
+        With normalize=True the vector is unit length, so it can be passed to
+        compute_visual_similarity(..., assume_normalized=True)
     """
     model, processor, device = get_clip_model()
     
     try:
         # Load image
-        from PIL import Image
         image = Image.open(image_path).convert("RGB")
         
         if processor is not None:
             # Real CLIP model
-            import torch
             inputs = processor(images=image, return_tensors="pt")
             inputs = {k: v.to(device) for k, v in inputs.items()}
+            inputs["pixel_values"] = inputs["pixel_values"].to(_clip_dtype)
             
-            with torch.no_grad():
+            with torch.inference_mode():
                 features = model.get_image_features(**inputs)
             
-            features = features.cpu().numpy().squeeze()
+            features = features.float().cpu().numpy().squeeze()
         else:
             # Fake model - pass pixel values directly
-            import torch
-            # Simple preprocessing for fake model
-            img_array = np.array(image.resize((224, 224))) / 255.0
-            pixel_values = torch.tensor(img_array).permute(2, 0, 1).unsqueeze(0).float()
-            features = model.get_image_features(pixel_values=pixel_values)
+            features = model.get_image_features(pixel_values=_fake_pixel_values([image]))
             features = features.numpy().squeeze()
         
-        # Normalize
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        
+        # Normalize in place
         if normalize:
             norm = np.linalg.norm(features)
             if norm > 0:
-                features = features / norm
+                features /= norm
         
-        return features.astype(np.float32)
+        if dtype == "int8":
+            return quantize_features(features)
+        return features
         
     except Exception as e:
         print(f"[CLIP] Error extracting features from {image_path}: {e}")
         return None
 
 
+def _open_rgb(path: str):
+    """Open an image as RGB, or return None if it cannot be read."""
+    try:
+        return Image.open(path).convert("RGB")
+    except Exception as e:
+        print(f"[CLIP] Failed to load image {path}: {e}")
+        return None
+
+
 def extract_visual_features_batch(
     image_paths: List[str],
-    normalize: bool = True
+    normalize: bool = True,
+    dtype: str = "float32"
 ) -> List[Optional[np.ndarray]]:
     """
     Extract visual features from multiple images in batch.
@@ -155,6 +295,7 @@ def extract_visual_features_batch(
     Args:
         image_paths: List of image file paths
         normalize: Whether to L2-normalize the features
+        dtype: "float32" (default) or "int8" for scalar-quantized output
     
     Returns:
         List of feature vectors (None for failed extractions)
@@ -163,52 +304,52 @@ def extract_visual_features_batch(
     results = []
     
     try:
-        from PIL import Image
-        import torch
-        
-        # Load all valid images
-        images = []
-        valid_indices = []
-        for i, path in enumerate(image_paths):
-            try:
-                img = Image.open(path).convert("RGB")
-                images.append(img)
-                valid_indices.append(i)
-            except Exception as e:
-                print(f"[CLIP] Failed to load image {path}: {e}")
+        # Decode images in parallel (PIL releases the GIL while decoding)
+        with ThreadPoolExecutor(max_workers=LOAD_WORKERS) as pool:
+            loaded = list(pool.map(_open_rgb, image_paths))
+        valid_indices = [i for i, img in enumerate(loaded) if img is not None]
+        images = [loaded[i] for i in valid_indices]
         
         if not images:
             return [None] * len(image_paths)
         
         if processor is not None:
-            # Real CLIP model - batch processing
-            inputs = processor(images=images, return_tensors="pt", padding=True)
-            inputs = {k: v.to(device) for k, v in inputs.items()}
+            # Real CLIP model - one forward pass per resolution bucket
+            buckets = defaultdict(list)
+            for i, img in enumerate(images):
+                buckets[min(img.size) // BUCKET_SIZE].append(i)
             
-            with torch.no_grad():
-                features = model.get_image_features(**inputs)
-            
-            features = features.cpu().numpy()
+            rows = [None] * len(images)
+            for members in buckets.values():
+                inputs = processor(images=[images[i] for i in members], return_tensors="pt", padding=True)
+                inputs = {k: v.to(device) for k, v in inputs.items()}
+                inputs["pixel_values"] = inputs["pixel_values"].to(_clip_dtype)
+                
+                with torch.inference_mode():
+                    bucket_features = model.get_image_features(**inputs)
+                
+                for i, row in zip(members, bucket_features.float().cpu().numpy()):
+                    rows[i] = row
+            features = np.stack(rows)
         else:
-            # Fake model
-            all_features = []
-            for img in images:
-                img_array = np.array(img.resize((224, 224))) / 255.0
-                pixel_values = torch.tensor(img_array).permute(2, 0, 1).unsqueeze(0).float()
-                feat = model.get_image_features(pixel_values=pixel_values)
-                all_features.append(feat.numpy().squeeze())
-            features = np.stack(all_features)
+            # Fake model - one batched call
+            features = model.get_image_features(pixel_values=_fake_pixel_values(images)).numpy()
+        
+        # C-contiguous float32 rows can be handed to FAISS without a copy
+        features = np.ascontiguousarray(features, dtype=np.float32)
         
-        # Normalize
+        # Normalize in place
         if normalize:
             norms = np.linalg.norm(features, axis=1, keepdims=True)
-            norms = np.where(norms > 0, norms, 1)
-            features = features / norms
+            np.divide(features, norms, out=features, where=norms > 0)
+        
+        if dtype == "int8":
+            features = quantize_features(features)
         
         # Map back to original indices
         results = [None] * len(image_paths)
         for i, idx in enumerate(valid_indices):
-            results[idx] = features[i].astype(np.float32)
+            results[idx] = features[i]
         
         return results
         
@@ -219,7 +360,8 @@ def extract_visual_features_batch(
 
 def compute_visual_similarity(
     features1: np.ndarray,
-    features2: np.ndarray
+    features2: np.ndarray,
+    assume_normalized: bool = False
 ) -> float:
     """
     Compute cosine similarity between two visual feature vectors.
@@ -227,19 +369,44 @@ def compute_visual_similarity(
     Args:
         features1: First feature vector
         features2: Second feature vector
+        assume_normalized: Skip normalization when both vectors are already unit length
     
     Returns:
         Cosine similarity (0 to 1 for normalized vectors)
     """
-    # Ensure vectors are normalized
-    norm1 = np.linalg.norm(features1)
-    norm2 = np.linalg.norm(features2)
+    dot = float(np.dot(features1, features2))
+    if assume_normalized:
+        return dot
     
-    if norm1 == 0 or norm2 == 0:
+    # Ensure vectors are normalized
+    norm_sq = float(np.dot(features1, features1)) * float(np.dot(features2, features2))
+    if norm_sq == 0:
         return 0.0
     
-    similarity = np.dot(features1, features2) / (norm1 * norm2)
-    return float(similarity)
+    return dot / norm_sq ** 0.5
+
+
+def _unit_rows(features: np.ndarray) -> np.ndarray:
+    features = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.where(norms > 0, norms, 1)
+
+
+def compute_visual_similarity_batch(
+    queries: np.ndarray,
+    gallery: np.ndarray
+) -> np.ndarray:
+    """
+    Compute cosine similarities between every query and every gallery vector.
+    
+    Args:
+        queries: Query feature matrix, shape (Q, D)
+        gallery: Gallery feature matrix, shape (G, D)
+    
+    Returns:
+        Similarity matrix, shape (Q, G); zero vectors give similarity 0
+    """
+    return _unit_rows(queries) @ _unit_rows(gallery).T
 
 
 def get_clip_dimension() -> int:
@@ -274,7 +441,6 @@ if __name__ == "__main__":
         os.environ["DISABLE_CLIP"] = "1"
         
         # Create a dummy test
-        from PIL import Image
         dummy_img = Image.new("RGB", (224, 224), color="red")
         dummy_path = "test_dummy.png"
         dummy_img.save(dummy_path)
@@ -7,42 +7,87 @@ import os
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+try:
+    import orjson
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    orjson = None
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
+
 _config_cache: Optional[Dict[str, Any]] = None
+# File the cache was read from and its st_mtime_ns, to reload when it changes
+_config_cache_path: Optional[Path] = None
+_config_cache_mtime: Optional[int] = None
+# Dot-separated key -> value for every node of the cached config (e.g. "llm.api_key")
+_flat_cache: Dict[str, Any] = {}
+
+
+def _flatten(config: Dict[str, Any], prefix: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Map every nested key path to its value, including intermediate dicts."""
+    if out is None:
+        out = {}
+    for k, v in config.items():
+        path = f"{prefix}{k}"
+        out[path] = v
+        if isinstance(v, dict):
+            _flatten(v, f"{path}.", out)
+    return out
 
 
 def load_config(config_path: Optional[str] = None) -> Dict[str, Any]:
     """
     Load configuration file
     
+    The parsed config is cached and re-read only when the file's mtime changes,
+    so edits are picked up by long-running processes.
+    
     Args:
-        config_path: Configuration file path, defaults to config.json in project root
+        config_path: Configuration file path, defaults to the previously loaded
+                     file, or config.json in project root
     
     Returns:
         Configuration dictionary
     """
-    global _config_cache
-    
-    # Use cache to avoid repeated reads
-    if _config_cache is not None:
-        return _config_cache
+    global _config_cache, _flat_cache, _config_cache_path, _config_cache_mtime
     
     # Determine config file path
-    if config_path is None:
+    if config_path is not None:
+        config_path = Path(config_path)
+    elif _config_cache_path is not None:
+        config_path = _config_cache_path
+    else:
         # Default to config.json in project root
         current_file = Path(__file__)
         project_root = current_file.parent.parent
         config_path = project_root / "config.json"
-    else:
-        config_path = Path(config_path)
     
-    # Read configuration file
-    if not config_path.exists():
-        raise FileNotFoundError(f"Configuration file not found: {config_path}")
+    try:
+        mtime = os.stat(config_path).st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Configuration file not found: {config_path}") from None
     
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
+    # Use cache to avoid repeated reads
+    if _config_cache is not None and config_path == _config_cache_path and mtime == _config_cache_mtime:
+        return _config_cache
+    
+    # Read configuration file
+    with open(config_path, 'rb') as f:
+        config = _loads(f.read())
     
     _config_cache = config
+    _flat_cache = _flatten(config)
+    _config_cache_path = config_path
+    _config_cache_mtime = mtime
     return config
 
 
@@ -65,7 +110,8 @@ def get_config_value(key: str, default: Any = None, config: Optional[Dict] = Non
         "gemini-2.5-flash"
     """
     if config is None:
-        config = load_config()
+        load_config()
+        return _flat_cache.get(key, default)
     
     # Support dot-separated nested keys
     keys = key.split('.')
@@ -100,8 +146,8 @@ def sync_unity_config():
         return
     
     # Read Unity config
-    with open(unity_config_path, 'r', encoding='utf-8') as f:
-        unity_config = json.load(f)
+    with open(unity_config_path, 'rb') as f:
+        unity_config = _loads(f.read())
     
     # Check if update is needed
     current_path = unity_config.get("outputBasePath")
@@ -113,8 +159,8 @@ def sync_unity_config():
         unity_config["agentControlRequestDir"] = f"{output_base_path}\\agent_requests"
         
         # Write back to file
-        with open(unity_config_path, 'w', encoding='utf-8') as f:
-            json.dump(unity_config, f, indent=4)
+        with open(unity_config_path, 'wb') as f:
+            f.write(_dumps(unity_config))
         
         print(f"[Config Sync] Unity config file updated")
     else:
@@ -1,37 +1,295 @@
 """
 Text Embedding utilities - Uses sentence-transformers (can be disabled via env var for local verification)
 """
+import hashlib
+import importlib.util
 import os
+import platform
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import nullcontext
 import numpy as np
 
 # Global model instance (avoid repeated loading)
 _model = None
+_model_lock = threading.Lock()
+_torch = None  # set once the real (torch-based) model is loaded
+_encoder = None
+_encoder_lock = threading.Lock()
+
+# get_embedding requests are coalesced into batches of up to MAX_BATCH texts,
+# waiting at most MAX_WAIT_MS for more requests to arrive
+MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "2"))
+
+# Embedding cache: in-memory LRU of CACHE_SIZE texts, plus an optional sqlite
+# store under EMBEDDING_CACHE_DIR shared across processes (real model only)
+CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_cache_lock = threading.Lock()
+_disk_cache = None
+
+# EMB_DTYPE=int8 makes get_embedding* return symmetric int8 codes
+# (see similarity.quantize_i8 / cosine_i8) instead of float32 vectors
+EMB_DTYPE = os.getenv("EMB_DTYPE", "float32")
+
+
+def _intel_cpu() -> bool:
+    """Best-effort check for an Intel CPU."""
+    if "intel" in platform.processor().lower():
+        return True
+    try:
+        with open("/proc/cpuinfo") as f:
+            return any(line.startswith("vendor_id") and "GenuineIntel" in line for line in f)
+    except OSError:
+        return False
+
+
+def _default_backend() -> str:
+    """OpenVINO on Intel CPUs when installed, ONNX Runtime otherwise."""
+    if _intel_cpu() and importlib.util.find_spec("openvino") is not None:
+        return "openvino"
+    return "onnx"
+
+
+# sentence-transformers inference backend: "openvino", "onnx" (ONNX Runtime) or "torch".
+# When unset, it is detected on first model load rather than at import time
+# (platform.processor() spawns a subprocess).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND")
+
+
+def _cpu_has_flag(flag: str) -> bool:
+    """Check /proc/cpuinfo for a CPU feature flag (False where unavailable)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            return any(line.startswith("flags") and flag in line.split() for line in f)
+    except OSError:
+        return False
+
+
+def _onnx_file_name() -> str:
+    """ONNX weights to load: int8 on AVX512-VNNI CPUs, FP32 otherwise (EMBEDDING_ONNX_FILE overrides)."""
+    override = os.getenv("EMBEDDING_ONNX_FILE")
+    if override:
+        return override
+    if _cpu_has_flag("avx512_vnni"):
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    return "onnx/model.onnx"
+
+
+def _backend_model_kwargs(backend: str) -> dict:
+    """Extra SentenceTransformer model_kwargs for the non-PyTorch backends."""
+    if backend == "openvino":
+        # int8 OpenVINO IR shipped with all-MiniLM-L6-v2 (EMBEDDING_OPENVINO_FILE overrides)
+        return {"file_name": os.getenv("EMBEDDING_OPENVINO_FILE", "openvino/openvino_model_qint8_quantized.xml")}
+    return {"provider": "CPUExecutionProvider", "file_name": _onnx_file_name()}
+
+
+def _load_embedding_model():
+    """Build the embedding model (real or fake); see get_embedding_model."""
+    global _torch
+    if os.getenv("DISABLE_EMBEDDING"):
+        class _FakeModel:
+            def encode(self, texts, convert_to_numpy=True, **kwargs):
+                single = not isinstance(texts, (list, tuple))
+                batch = [texts] if single else texts
+                seeds = np.fromiter((abs(hash(t)) & 0xFFFFFFFF for t in batch), dtype=np.uint64, count=len(batch))
+                # Counter-based hashing: every (text, component) pair gets its own
+                # pseudo-random draw, so a text's vector is independent of the batch
+                counters = seeds[:, None] * np.uint64(2 * 384) + np.arange(2 * 384, dtype=np.uint64)
+                bits = _splitmix64(counters) >> np.uint64(11)
+                uniform = bits.astype(np.float64)
+                uniform += 0.5
+                uniform *= 1.0 / 2**53
+                # Box-Muller: two uniforms -> one standard normal per component,
+                # computed in place and written straight into the float32 output
+                radius, angle = uniform[:, :384], uniform[:, 384:]
+                np.log(radius, out=radius)
+                radius *= -2.0
+                np.sqrt(radius, out=radius)
+                angle *= 2 * np.pi
+                np.cos(angle, out=angle)
+                vecs = np.empty((len(batch), 384), dtype=np.float32)
+                np.multiply(radius, angle, out=vecs, casting="same_kind")
+                # normalize
+                vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+                return vecs[0] if single else vecs
+        model = _FakeModel()
+    else:
+        from sentence_transformers import SentenceTransformer  # lazy import
+        backend = EMBEDDING_BACKEND or _default_backend()
+        # Use lightweight model: all-MiniLM-L6-v2 (80MB, fast)
+        if backend == "torch":
+            model = SentenceTransformer('all-MiniLM-L6-v2')
+        else:
+            try:
+                model = SentenceTransformer(
+                    'all-MiniLM-L6-v2',
+                    backend=backend,
+                    model_kwargs=_backend_model_kwargs(backend),
+                )
+            except Exception as e:
+                print(f"[Embedding] {backend} backend unavailable ({e}), using PyTorch")
+                model = SentenceTransformer('all-MiniLM-L6-v2')
+        import torch
+        _torch = torch
+        # Intra-op threads default to all cores; ST_NUM_THREADS overrides
+        torch.set_num_threads(int(os.getenv("ST_NUM_THREADS", os.cpu_count() or 1)))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # can only be set before any inter-op work has started
+        model.eval()
+        # Pay session/graph initialization now rather than on the first real call
+        _encode(model, "warmup")
+    return model
 
 
 def get_embedding_model():
-    """Get or initialize embedding model"""
+    """
+    Get or initialize embedding model
+    
+    Thread-safe: concurrent first calls load the model only once.
+    """
     global _model
+    
     if _model is None:
-        if os.getenv("DISABLE_EMBEDDING"):
-            class _FakeModel:
-                def encode(self, texts, convert_to_numpy=True):
-                    def encode_one(t: str):
-                        rng = np.random.default_rng(abs(hash(t)) % (2**32))
-                        vec = rng.standard_normal(384).astype(np.float32)
-                        # normalize
-                        vec /= (np.linalg.norm(vec) + 1e-12)
-                        return vec
-                    if isinstance(texts, (list, tuple)):
-                        return np.stack([encode_one(t) for t in texts], axis=0)
-                    return encode_one(texts)
-            _model = _FakeModel()
-        else:
-            from sentence_transformers import SentenceTransformer  # lazy import
-            # Use lightweight model: all-MiniLM-L6-v2 (80MB, fast)
-            _model = SentenceTransformer('all-MiniLM-L6-v2')
+        with _model_lock:
+            if _model is None:
+                # Published only after warmup, so unlocked readers never see a partial load
+                _model = _load_embedding_model()
+    
     return _model
 
 
+def _encode(model, texts, **kwargs) -> np.ndarray:
+    """model.encode without autograd bookkeeping (inference_mode is per thread); rows are unit-norm."""
+    with _torch.inference_mode() if _torch is not None else nullcontext():
+        return model.encode(texts, convert_to_numpy=True, normalize_embeddings=True, **kwargs)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Vectorized SplitMix64 finalizer (uint64 arithmetic wraps)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class BatchingEncoder:
+    """
+    Coalesces single-text encode requests from many threads into batched encode calls.
+    
+    A background thread drains the request queue, sorts each batch by text length
+    (so padding is minimal), encodes it in one call and resolves the futures.
+    """
+    
+    def __init__(self, model, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests: "queue.Queue[tuple]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="embedding-encoder", daemon=True)
+        self.thread.start()
+    
+    def submit(self, text: str) -> Future:
+        """Queue a text for encoding; the future resolves to its embedding."""
+        future = Future()
+        self.requests.put((text, future))
+        return future
+    
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self.requests.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            
+            order = sorted(range(len(batch)), key=lambda i: len(batch[i][0]))
+            try:
+                embeddings = _encode(self.model, [batch[i][0] for i in order], batch_size=64)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for row, i in enumerate(order):
+                batch[i][1].set_result(embeddings[row])
+
+
+def _get_encoder() -> BatchingEncoder:
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = BatchingEncoder(get_embedding_model())
+    return _encoder
+
+
+def _get_disk_cache():
+    """Open the sqlite embedding store once, if configured and a real model is used."""
+    global _disk_cache
+    if _disk_cache is None:
+        if CACHE_DIR and not os.getenv("DISABLE_EMBEDDING"):
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _disk_cache = sqlite3.connect(os.path.join(CACHE_DIR, "embeddings.sqlite3"), check_same_thread=False)
+            _disk_cache.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, vec BLOB)")
+        else:
+            _disk_cache = False
+    return _disk_cache
+
+
+def _disk_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _cache_get(text: str):
+    """Return a copy of the cached embedding for text, or None."""
+    with _cache_lock:
+        vec = _cache.get(text)
+        if vec is not None:
+            _cache.move_to_end(text)
+            return vec.copy()
+        db = _get_disk_cache()
+        if db:
+            row = db.execute("SELECT vec FROM emb WHERE key = ?", (_disk_key(text),)).fetchone()
+            if row is not None:
+                vec = np.frombuffer(row[0], dtype=np.float32)
+                _cache_put_locked(text, vec, persist=False)
+                return vec.copy()
+    return None
+
+
+def _cache_put_locked(text: str, vec: np.ndarray, persist: bool = True):
+    _cache[text] = vec
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    db = _get_disk_cache() if persist else None
+    if db:
+        db.execute("INSERT OR REPLACE INTO emb VALUES (?, ?)", (_disk_key(text), np.asarray(vec, dtype=np.float32).tobytes()))
+        db.commit()
+
+
+def _cache_put(text: str, vec: np.ndarray):
+    with _cache_lock:
+        _cache_put_locked(text, vec.copy())
+
+
+def _to_output_dtype(embeddings: np.ndarray) -> np.ndarray:
+    """Quantize rows to int8 when EMB_DTYPE=int8 (the cache always holds float32)."""
+    if EMB_DTYPE != "int8":
+        return embeddings
+    from .similarity import quantize_i8
+    if embeddings.ndim == 1:
+        return quantize_i8(embeddings)[0]
+    return np.stack([quantize_i8(row)[0] for row in embeddings])
+
+
 def get_embedding(text: str) -> np.ndarray:
     """
     Get embedding vector for text
@@ -40,11 +298,17 @@ def get_embedding(text: str) -> np.ndarray:
         text: Input text
     
     Returns:
-        Embedding vector (384 dimensions)
+        Embedding vector (384 dimensions), L2-normalized so cosine similarity
+        is a plain dot product (int8 codes when EMB_DTYPE=int8)
     """
-    model = get_embedding_model()
-    embedding = model.encode(text, convert_to_numpy=True)
-    return embedding
+    cached = _cache_get(text)
+    if cached is not None:
+        return _to_output_dtype(cached)
+    
+    # Concurrent callers share one batched encode call
+    embedding = _get_encoder().submit(text).result()
+    _cache_put(text, embedding)
+    return _to_output_dtype(embedding)
 
 
 def get_embeddings_batch(texts: list) -> np.ndarray:
@@ -55,11 +319,38 @@ def get_embeddings_batch(texts: list) -> np.ndarray:
         texts: List of texts
     
     Returns:
-        Embeddings matrix, shape (len(texts), 384)
+        Embeddings matrix, shape (len(texts), 384), rows L2-normalized
+        (int8 codes when EMB_DTYPE=int8)
     """
-    model = get_embedding_model()
-    embeddings = model.encode(texts, convert_to_numpy=True)
-    return embeddings
+    cached = [_cache_get(t) for t in texts]
+    misses = [i for i, vec in enumerate(cached) if vec is None]
+    if len(misses) == len(texts):
+        embeddings = _encode(get_embedding_model(), list(texts))
+        for t, vec in zip(texts, embeddings):
+            _cache_put(t, vec)
+        return _to_output_dtype(embeddings)
+    
+    # Encode only the misses and reassemble in input order
+    embeddings = np.empty((len(texts), len(next(v for v in cached if v is not None))), dtype=np.float32)
+    if misses:
+        encoded = _encode(get_embedding_model(), [texts[i] for i in misses])
+        for i, vec in zip(misses, encoded):
+            embeddings[i] = vec
+            _cache_put(texts[i], vec)
+    for i, vec in enumerate(cached):
+        if vec is not None:
+            embeddings[i] = vec
+    return _to_output_dtype(embeddings)
+
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Cosine similarity between two embedding vectors
+    
+    Uses one sqrt over vdot products instead of two np.linalg.norm calls.
+    Embeddings from this module are already unit-norm, so np.dot(a, b) suffices there.
+    """
+    return float(np.dot(a, b) / np.sqrt(np.vdot(a, a) * np.vdot(b, b)))
 
 
 if __name__ == "__main__":
@@ -81,14 +372,18 @@ if __name__ == "__main__":
     embs = get_embeddings_batch(test_texts)
     print(f"\nBatch embeddings shape: {embs.shape}")
     
-    # Calculate similarity
-    from numpy.linalg import norm
+    # Calculate similarity (SimSIMD kernels when installed, NumPy otherwise)
+    from similarity import cosine, topk
     
     # Similarity between text 0 and text 1
-    sim_01 = np.dot(embs[0], embs[1]) / (norm(embs[0]) * norm(embs[1]))
+    sim_01 = cosine(embs[0], embs[1])
     print(f"Similarity between text 0 and 1: {sim_01:.4f}")
     
     # Similarity between text 0 and query
-    sim_02 = np.dot(embs[0], embs[2]) / (norm(embs[0]) * norm(embs[2]))
+    sim_02 = cosine(embs[0], embs[2])
     print(f"Similarity between text 0 and query: {sim_02:.4f}")
+    
+    # Closest stored text to the query
+    indices, sims = topk(embs[2], embs[:2], k=1)
+    print(f"Best match for query: text {indices[0]} ({sims[0]:.4f})")
 
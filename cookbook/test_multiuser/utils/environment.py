@@ -1,9 +1,37 @@
 """
 Environment simulation utilities
 """
-import random
+import operator
+import sys
+import numpy as np
+from collections import defaultdict, deque
+from dataclasses import dataclass, asdict
+from functools import reduce
 from typing import List, Dict, Any
 
+# Position change per action; unknown actions stay in place
+_DELTA = {"forward": 1, "backward": -1}
+
+
+@dataclass(frozen=True, slots=True)
+class Message:
+    """
+    Immutable agent message
+    
+    Frozen, so one instance can be shared by the history and every mailbox
+    without copying. Supports msg["sender"]-style reads for dict-based callers.
+    """
+    sender: str
+    recipient: str
+    message: str
+    
+    def __getitem__(self, key: str) -> str:
+        return getattr(self, key)
+    
+    def to_dict(self) -> Dict[str, str]:
+        """Plain dict for JSON serialization"""
+        return asdict(self)
+
 
 def create_shared_memory() -> Dict[str, Any]:
     """
@@ -13,13 +41,13 @@ def create_shared_memory() -> Dict[str, Any]:
         Shared memory dictionary with the following structure:
         - objects: Set of discovered objects (only increases, never decreases)
         - agent_positions: Dict mapping agent_id -> current position
-        - message_mailboxes: Dict mapping agent_id -> list of messages (each agent has its own mailbox)
+        - message_mailboxes: Dict mapping agent_id -> deque of messages (each agent has its own mailbox)
         - message_history: List of all messages (never deleted)
     """
     return {
         "objects": set(),  # All unique objects discovered across all positions (only increases)
         "agent_positions": {},
-        "message_mailboxes": {},  # Dict: {agent_id: [msg1, msg2, ...]}
+        "message_mailboxes": defaultdict(deque),  # Dict: {agent_id: deque([msg1, msg2, ...])}
         "message_history": []
     }
 
@@ -42,18 +70,30 @@ def create_environment(num_positions: int = 10, object_pool: List[str] = None) -
             "plant", "picture", "clock", "vase", "mirror",
             "cushion", "rug", "shelf", "drawer", "cabinet"
         ]
-    
-    # Randomly assign 1-3 objects to each position
-    objects = {}
-    for pos in range(num_positions):
-        num_objects = random.randint(1, 3)
-        objects[pos] = random.sample(object_pool, num_objects)
+    # Interned, so every position's object list shares one str per name;
+    # deduplicated, so each name gets exactly one mask bit below
+    object_pool = list(dict.fromkeys(sys.intern(s) for s in object_pool))
+    
+    # Randomly assign 1-3 objects to each position (all draws in one NumPy call each):
+    # the first k columns of a per-row random permutation are a k-sample without replacement
+    rng = np.random.default_rng()
+    max_objects = min(3, len(object_pool))
+    sizes = rng.integers(1, max_objects + 1, size=num_positions).tolist()
+    picks = rng.random((num_positions, len(object_pool))).argpartition(max_objects - 1, axis=1)[:, :max_objects].tolist()
+    objects = {pos: [object_pool[i] for i in row[:k]] for pos, (row, k) in enumerate(zip(picks, sizes))}
+    
+    # Bitmask of each position's objects (bit i = object_pool[i]), so exploration
+    # tracking is an integer OR and the explored set is only touched on new objects
+    bit_of = {obj: 1 << i for i, obj in enumerate(object_pool)}
+    object_masks = {pos: reduce(operator.or_, (bit_of[obj] for obj in objs), 0) for pos, objs in objects.items()}
     
     return {
         "objects": objects,
+        "object_masks": object_masks,
+        "explored_mask": 0,
         "num_positions": num_positions,
         "agent_positions": {},
-        "message_mailboxes": {},  # Dict: {agent_id: [msg1, msg2, ...]}
+        "message_mailboxes": defaultdict(deque),  # Dict: {agent_id: deque([msg1, msg2, ...])}
         "message_history": [],
         "explored_by_all": set()
     }
@@ -85,24 +125,58 @@ def execute_action(agent_id: str, action: str, env: Dict[str, Any]) -> int:
     Returns:
         New position
     """
+    agent_id = sys.intern(agent_id)  # agent IDs are dict keys on every hot path
     current_pos = env["agent_positions"].get(agent_id, 0)
     
-    if action == "forward":
-        new_pos = min(current_pos + 1, env["num_positions"] - 1)
-    elif action == "backward":
-        new_pos = max(current_pos - 1, 0)
-    else:
-        new_pos = current_pos  # Invalid action, stay in place
+    # Clamp to [0, num_positions - 1]
+    new_pos = current_pos + _DELTA.get(action, 0)
+    if new_pos < 0:
+        new_pos = 0
+    elif new_pos >= env["num_positions"]:
+        new_pos = env["num_positions"] - 1
     
     env["agent_positions"][agent_id] = new_pos
-    
-    # Update global exploration record
-    visible = get_visible_objects(new_pos, env)
-    env["explored_by_all"].update(visible)
+    _mark_explored(new_pos, env)
     
     return new_pos
 
 
+def execute_actions(agent_ids: List[str], actions: List[str], env: Dict[str, Any]) -> List[int]:
+    """
+    Execute one action per agent in a single vectorized step
+    
+    Args:
+        agent_ids: Agent identifiers (distinct)
+        actions: "forward" or "backward" for each agent
+        env: Environment dictionary
+    
+    Returns:
+        New positions, in the same order as agent_ids
+    """
+    agent_ids = [sys.intern(a) for a in agent_ids]
+    positions = env["agent_positions"]
+    current = np.fromiter((positions.get(a, 0) for a in agent_ids), dtype=np.int64, count=len(agent_ids))
+    deltas = np.fromiter((_DELTA.get(a, 0) for a in actions), dtype=np.int64, count=len(actions))
+    new_positions = np.clip(current + deltas, 0, env["num_positions"] - 1).tolist()
+    
+    positions.update(zip(agent_ids, new_positions))
+    for pos in set(new_positions):
+        _mark_explored(pos, env)
+    
+    return new_positions
+
+
+def _mark_explored(position: int, env: Dict[str, Any]):
+    """Update the global exploration record with the objects at position."""
+    masks = env.get("object_masks")
+    if masks is None:
+        env["explored_by_all"].update(get_visible_objects(position, env))
+    elif masks.get(position, 0) & ~env["explored_mask"]:
+        # Something here has not been explored yet
+        env["explored_mask"] |= masks[position]
+        env["explored_by_all"].update(get_visible_objects(position, env))
+
+
 def add_message(env: Dict[str, Any], sender: str, recipient: str, message: str):
     """
     Add message between agents using mailbox system
@@ -117,20 +191,18 @@ def add_message(env: Dict[str, Any], sender: str, recipient: str, message: str):
         recipient: Recipient agent_id (can be specific agent or "all")
         message: Message content
     """
-    msg = {
-        "sender": sender,
-        "recipient": recipient,
-        "message": message
-    }
+    sender, recipient = sys.intern(sender), sys.intern(recipient)
+    msg = Message(sender, recipient, message)
     
     # Ensure message_mailboxes exists
     if "message_mailboxes" not in env:
-        env["message_mailboxes"] = {}
+        env["message_mailboxes"] = defaultdict(deque)
+    mailboxes = env["message_mailboxes"]
     
     # Also save to history (never deleted)
     if "message_history" not in env:
         env["message_history"] = []
-    env["message_history"].append(msg.copy())
+    env["message_history"].append(msg)
     
     # Deliver to mailbox(es)
     if recipient == "all":
@@ -139,25 +211,20 @@ def add_message(env: Dict[str, Any], sender: str, recipient: str, message: str):
         all_agents.discard(sender)  # Remove sender (agents don't receive their own messages)
         
         for agent_id in all_agents:
-            if agent_id not in env["message_mailboxes"]:
-                env["message_mailboxes"][agent_id] = []
-            env["message_mailboxes"][agent_id].append(msg.copy())
+            mailboxes.setdefault(agent_id, deque()).append(msg)
     else:
         # Send to specific agent (but not if it's the sender)
         if recipient != sender:
-            if recipient not in env["message_mailboxes"]:
-                env["message_mailboxes"][recipient] = []
-            env["message_mailboxes"][recipient].append(msg.copy())
+            mailboxes.setdefault(recipient, deque()).append(msg)
 
 
-def get_messages_for(env: Dict[str, Any], agent_id: str) -> List[Dict[str, str]]:
+def get_messages_for(env: Dict[str, Any], agent_id: str) -> List[Message]:
     """
     Get messages for specified agent from their mailbox (and clear the mailbox)
     
-    Each agent has its own mailbox. This function:
-    1. Retrieves all messages from the agent's mailbox
-    2. Filters out messages sent by the agent itself (safety check)
-    3. Clears the mailbox after reading
+    Each agent has its own mailbox. This function drains it: returns all queued
+    messages in arrival order and leaves the mailbox empty. add_message never
+    delivers an agent's own messages, so no sender filtering is needed.
     
     Args:
         env: Environment dictionary
@@ -166,18 +233,14 @@ def get_messages_for(env: Dict[str, Any], agent_id: str) -> List[Dict[str, str]]
     Returns:
         List of messages
     """
-    # Ensure message_mailboxes exists
-    if "message_mailboxes" not in env:
-        env["message_mailboxes"] = {}
-    
     # Get agent's mailbox
-    mailbox = env["message_mailboxes"].get(agent_id, [])
-    
-    # Filter out self-messages (shouldn't happen with mailbox system, but safety check)
-    messages = [msg for msg in mailbox if msg.get("sender") != agent_id]
+    mailbox = env.get("message_mailboxes", {}).get(agent_id)
+    if not mailbox:
+        return []
     
-    # Clear the mailbox after reading
-    env["message_mailboxes"][agent_id] = []
+    # Drain the mailbox: O(messages delivered), independent of other agents' traffic
+    messages = list(mailbox)
+    mailbox.clear()
     
     return messages
 
@@ -227,12 +290,12 @@ if __name__ == "__main__":
     messages = get_messages_for(env, "agent2")
     print(f"\nAgent2 receives {len(messages)} messages:")
     for msg in messages:
-        print(f"  From {msg['sender']}: {msg['message']}")
+        print(f"  From {msg.sender}: {msg.message}")
     
     messages = get_messages_for(env, "agent1")
     print(f"\nAgent1 receives {len(messages)} messages:")
     for msg in messages:
-        print(f"  From {msg['sender']}: {msg['message']}")
+        print(f"  From {msg.sender}: {msg.message}")
     
     print(f"\nMailbox status after reading:")
     print(f"  Agent1 mailbox: {len(env['message_mailboxes'].get('agent1', []))} messages")
@@ -2,27 +2,108 @@
 Logging utility for Multi-Agent system.
 
 This module provides a simple way to log messages to both console and file.
-All print statements should be replaced with log() calls for file logging.
+Records go through a logging QueueHandler; a single QueueListener thread formats
+and writes them, so producers only enqueue and lines from different threads
+never interleave. Console output written with print() is captured line by line
+(via a sys.stdout wrapper, not by replacing print) into the same log.
 
 Usage:
     from utils.logger import setup_logger, log
-
+    
     # At program start
     setup_logger("Agent1")  # Creates logs/Agent1_20260109_123456.txt
-
-    # Replace print() with log()
+    
+    # print() output is captured; log() writes a message explicitly
     log("[Agent1] Starting exploration...")
 """
 
+import logging
 import os
+import queue
+import signal
 import sys
-from datetime import datetime
-from pathlib import Path
+import threading
+import time
 from typing import Optional
 
-# Global log file handle
-_log_file = None
+# Log writes are buffered; a background thread flushes every FLUSH_INTERVAL seconds
+LOG_BUFFER_SIZE = 1 << 16
+FLUSH_INTERVAL = 1.0
+
+_logger = logging.getLogger("multiuser")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+
+_file_handler = None
+_queue_handler = None
+_listener = None
 _log_enabled = True
+_also_print = True
+_console = None  # original sys.stdout
+_flush_thread = None
+
+# "%H:%M:%S" for the current second, reformatted only when the second changes
+_last_sec = [0]
+_last_str = [""]
+
+
+def _timestamp(created: Optional[float] = None) -> str:
+    s = int(time.time() if created is None else created)
+    if s != _last_sec[0]:
+        _last_sec[0] = s
+        _last_str[0] = time.strftime("%H:%M:%S", time.localtime(s))
+    return _last_str[0]
+
+
+class _Formatter(logging.Formatter):
+    """"[HH:MM:SS] message" using the cached per-second timestamp."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        return f"[{_timestamp(record.created)}] {record.getMessage()}"
+
+
+class _BufferedFileHandler(logging.FileHandler):
+    """FileHandler with a large write buffer that flushes only on checkpoint()."""
+    
+    def _open(self):
+        return open(self.baseFilename, self.mode, encoding=self.encoding, buffering=LOG_BUFFER_SIZE)
+    
+    def flush(self):
+        pass  # see checkpoint()
+    
+    def checkpoint(self):
+        with self.lock:
+            if self.stream and not self.stream.closed:
+                self.stream.flush()
+
+
+class _StdoutCapture:
+    """
+    sys.stdout wrapper that forwards complete lines to the log.
+    
+    Partial writes are buffered per thread, so print()'s separate text/newline
+    writes from concurrent threads still produce whole lines.
+    """
+    
+    def __init__(self, console):
+        self.console = console
+        self.local = threading.local()
+    
+    def write(self, text: str) -> int:
+        if _also_print:
+            self.console.write(text)
+        if _log_enabled and _queue_handler is not None:
+            pending = getattr(self.local, "pending", "") + text
+            *lines, self.local.pending = pending.split("\n")
+            for line in lines:
+                _logger.info(line)
+        return len(text)
+    
+    def flush(self):
+        self.console.flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.console, name)
 
 
 def setup_logger(
@@ -41,7 +122,14 @@ def setup_logger(
     Returns:
         Path to the log file
     """
-    global _log_file, _log_enabled
+    global _file_handler, _queue_handler, _listener, _log_enabled, _also_print, _console, _flush_thread
+    # Imported here so that importing the module stays cheap for processes that never log
+    from datetime import datetime
+    from logging.handlers import QueueHandler, QueueListener
+    from pathlib import Path
+    
+    if _listener is not None:
+        close_logger()
     
     # Create log directory
     log_path = Path(log_dir)
@@ -53,44 +141,72 @@ def setup_logger(
     log_filepath = log_path / log_filename
     
     # Open log file
-    _log_file = open(log_filepath, "w", encoding="utf-8")
+    _file_handler = _BufferedFileHandler(log_filepath, mode="w", encoding="utf-8")
+    _file_handler.setFormatter(_Formatter())
     _log_enabled = True
+    _also_print = also_print
     
     # Write header
-    _log_file.write(f"=" * 60 + "\n")
-    _log_file.write(f"Log started at: {datetime.now().isoformat()}\n")
-    _log_file.write(f"Name: {name}\n")
-    _log_file.write(f"=" * 60 + "\n\n")
-    _log_file.flush()
+    _file_handler.stream.write(f"=" * 60 + "\n")
+    _file_handler.stream.write(f"Log started at: {datetime.now().isoformat()}\n")
+    _file_handler.stream.write(f"Name: {name}\n")
+    _file_handler.stream.write(f"=" * 60 + "\n\n")
+    _file_handler.checkpoint()
+    
+    # Producers enqueue records; one listener thread writes the file
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _logger.addHandler(_queue_handler)
+    _listener = QueueListener(log_queue, _file_handler)
+    _listener.start()
     
-    # Override print function to also write to file
-    _setup_print_redirect(also_print)
+    # Capture print() output into the log
+    _console = sys.stdout
+    sys.stdout = _StdoutCapture(_console)
+    
+    # Periodic flush instead of one flush (syscall) per message
+    if _flush_thread is None:
+        _flush_thread = threading.Thread(target=_flush_loop, name="log-flush", daemon=True)
+        _flush_thread.start()
+    _install_sigterm_flush()
     
     return str(log_filepath)
 
 
-def _setup_print_redirect(also_print: bool = True):
+def checkpoint():
+    """
+    Flush buffered log output to disk.
+    """
+    handler = _file_handler
+    if handler is not None:
+        handler.checkpoint()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        checkpoint()
+
+
+def _install_sigterm_flush():
+    """Flush the log before exiting on SIGTERM (buffered lines would otherwise be lost)."""
+    def handle_sigterm(signum, frame):
+        if _listener is not None:
+            _listener.stop()  # drain queued records
+        checkpoint()
+        os._exit(0)
+    
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        pass  # signal handlers can only be installed from the main thread
+
+
+def get_logger() -> logging.Logger:
     """
-    Redirect print() to also write to log file.
+    Get the logger used for the log file.
     """
-    import builtins
-    original_print = builtins.print
-    
-    def custom_print(*args, **kwargs):
-        # Get the output string
-        output = " ".join(str(arg) for arg in args)
-        
-        # Write to log file if available
-        if _log_file and _log_enabled:
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            _log_file.write(f"[{timestamp}] {output}\n")
-            _log_file.flush()
-        
-        # Also print to console if enabled
-        if also_print:
-            original_print(*args, **kwargs)
-    
-    builtins.print = custom_print
+    return _logger
 
 
 def log(message: str, also_print: bool = True):
@@ -101,39 +217,48 @@ def log(message: str, also_print: bool = True):
         message: Message to log
         also_print: Whether to also print to console
     """
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    
     # Write to log file
-    if _log_file and _log_enabled:
-        _log_file.write(f"[{timestamp}] {message}\n")
-        _log_file.flush()
+    if _log_enabled and _queue_handler is not None:
+        _logger.info(message)
     
-    # Print to console if enabled
+    # Print to console if enabled (directly, so the line is not captured twice)
     if also_print:
-        print(message)
+        console = _console or sys.stdout
+        console.write(f"{message}\n")
 
 
 def close_logger():
     """
     Close the log file.
     """
-    global _log_file
-    if _log_file:
-        _log_file.write(f"\n{'=' * 60}\n")
-        _log_file.write(f"Log ended at: {datetime.now().isoformat()}\n")
-        _log_file.write(f"{'=' * 60}\n")
-        _log_file.close()
-        _log_file = None
+    global _file_handler, _queue_handler, _listener, _console
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        _logger.removeHandler(_queue_handler)
+        _queue_handler = None
+    if _console is not None:
+        if isinstance(sys.stdout, _StdoutCapture):
+            sys.stdout = _console
+        _console = None
+    if _file_handler is not None:
+        from datetime import datetime
+        _file_handler.stream.write(f"\n{'=' * 60}\n")
+        _file_handler.stream.write(f"Log ended at: {datetime.now().isoformat()}\n")
+        _file_handler.stream.write(f"{'=' * 60}\n")
+        _file_handler.checkpoint()
+        _file_handler.close()
+        _file_handler = None
 
 
 def get_log_file():
     """
     Get the current log file handle.
     """
-    return _log_file
+    return _file_handler.stream if _file_handler is not None else None
 
 
 # Ensure log file is closed on exit
 import atexit
 atexit.register(close_logger)
-
@@ -1,27 +1,229 @@
 """
 FAISS memory management utilities
+
+Vectors are L2-normalized on the way in, and every index uses inner product,
+so scores are cosine similarities (higher = more similar).
 """
+import itertools
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import faiss
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Concurrent users each search from their own thread (search_memory_many), so FAISS's
+# own OpenMP threads would oversubscribe the CPU; FAISS_SINGLE_THREAD=0 keeps them
+if os.getenv("FAISS_SINGLE_THREAD", "1") == "1":
+    faiss.omp_set_num_threads(1)
+
+# Below this many vectors a flat scan is as fast as IVF and needs no training
+IVF_MIN_SIZE = 10000
+# Vectors used to train IVF centroids, and inverted lists probed per query
+IVF_TRAIN_SIZE = 10000
+IVF_NPROBE = 8
+# HNSW graph degree and build/search beam widths
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Suggested add_to_memory(hnsw_threshold=...): a growing flat index is rebuilt as
+# HNSW once it holds this many vectors
+HNSW_MIGRATE_SIZE = 1000
+# Scalar quantizer code sizes for create_memory(quant=...), and vectors needed to
+# train their per-dimension value ranges
+SQ_TYPES = {"sq8": faiss.ScalarQuantizer.QT_8bit, "sq4": faiss.ScalarQuantizer.QT_4bit}
+SQ_TRAIN_SIZE = 256
+
+# Per-thread float32 staging buffers for add/search, reused across calls
+_staging = threading.local()
+
+# Untrained indexes (create_memory_ivfpq, create_memory(quant=...)): id(index) ->
+# (index, flat index holding the vectors added so far and searched until training
+# happens, number of vectors to train on)
+_training_buffers: Dict[int, Tuple[faiss.Index, faiss.Index, int]] = {}
+
+# Indexes opened by load_memory(mmap=True): id(index) -> index. Their vectors are
+# a read-only view of the file, and FAISS aborts the process on add, so add_to_memory refuses
+_mapped_indexes: Dict[int, faiss.Index] = {}
+
+# External IDs for create_memory(with_ids=True) indexes, unique within the process
+_memory_ids = itertools.count()
 
+# StandardGpuResources per GPU id; each one reserves a large scratch pool, so they are shared
+_gpu_resources = {}
 
-def create_memory(dimension: int = 384):
+
+def _num_gpus() -> int:
+    """GPUs usable by FAISS (0 with faiss-cpu)"""
+    if not hasattr(faiss, "StandardGpuResources"):
+        return 0
+    return faiss.get_num_gpus()
+
+
+def create_memory(
+    dimension: int = 384,
+    training_data: Optional[np.ndarray] = None,
+    use_pq: bool = False,
+    expected_size: Optional[int] = None,
+    use_gpu: bool = False,
+    gpu_id: int = 0,
+    quant: str = "none",
+    with_ids: bool = False
+):
     """
     Create FAISS index
     
     Args:
         dimension: Vector dimension (default 384, matches all-MiniLM-L6-v2)
+        training_data: Optional sample of expected vectors. With at least
+                       IVF_MIN_SIZE rows an IVF index is trained on it,
+                       otherwise a flat index is used
+        use_pq: Use IVFPQ (16 x 8-bit codes) instead of IVFFlat to save memory
+        expected_size: Expected number of memories. Without training_data, an
+                       HNSW graph index (no training needed) is used when this
+                       is at least IVF_MIN_SIZE
+        use_gpu: Move the index to a GPU when FAISS has one (flat or IVF only,
+                 HNSW has no GPU version); ignored with faiss-cpu
+        gpu_id: GPU to use
+        quant: "sq8" or "sq4" stores flat/HNSW vectors as 8-/4-bit scalar codes
+               (4x/8x smaller than float32). The quantizer trains on
+               training_data if it has SQ_TRAIN_SIZE rows, otherwise on the first
+               SQ_TRAIN_SIZE memories added. Ignored for IVF and GPU indexes
+        with_ids: Flat index whose memories have stable IDs (IndexIDMap2), so
+                  they can be pruned with remove_from_memory. Use a dict
+                  {id: text} as memory_texts. Other index options are ignored
     
     Returns:
-        FAISS index object
+        FAISS index object (inner product on unit vectors, i.e. cosine)
     """
-    # Use simple index with L2 distance
-    index = faiss.IndexFlatL2(dimension)
+    if with_ids:
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    
+    if use_gpu and _num_gpus() > 0:
+        # Brute force on the GPU beats an HNSW walk on the CPU, so expected_size is not used
+        index = create_memory(dimension, training_data, use_pq)
+        if gpu_id not in _gpu_resources:
+            _gpu_resources[gpu_id] = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(_gpu_resources[gpu_id], gpu_id, index)
+    
+    if quant != "none" and (training_data is None or len(training_data) < IVF_MIN_SIZE):
+        return _create_sq(dimension, SQ_TYPES[quant], training_data, expected_size)
+    
+    if training_data is None and expected_size is not None and expected_size >= IVF_MIN_SIZE:
+        return _create_hnsw(dimension)
+    
+    if training_data is None or len(training_data) < IVF_MIN_SIZE:
+        # Use simple index with inner product (cosine on normalized vectors)
+        index = faiss.IndexFlatIP(dimension)
+        return index
+    
+    # IVF: search only the nprobe closest clusters instead of every vector
+    train = np.array(training_data[:IVF_TRAIN_SIZE], dtype=np.float32)
+    faiss.normalize_L2(train)
+    # k-means wants ~39 training points per centroid
+    nlist = max(1, min(4096, int(4 * math.sqrt(len(training_data))), len(train) // 39))
+    quantizer = faiss.IndexFlatIP(dimension)
+    if use_pq:
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, 16, 8, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(train)
+    index.nprobe = IVF_NPROBE
+    return index
+
+
+def create_memory_ivfpq(
+    dimension: int = 384,
+    expected_size: int = 100000,
+    nlist: Optional[int] = None,
+    m: int = 16,
+    nbits: int = 8
+):
+    """
+    Create a compressed IVFPQ index that trains itself from the first memories
+    
+    Each vector is stored as m codes of nbits (16 bytes by default, vs 1536 for
+    384 float32s), so memory stays bounded in long sessions. Vectors added
+    before there are enough to train on (39 per IVF list and per PQ
+    centroid) are kept in a flat
+    index and searched exactly; add_to_memory then trains and moves them over.
+    
+    Args:
+        dimension: Vector dimension (must be divisible by m)
+        expected_size: Expected number of memories, sets the default nlist
+        nlist: Number of inverted lists (default 4 * sqrt(expected_size), at least 32)
+        m: Number of PQ sub-quantizers
+        nbits: Bits per PQ code
+    
+    Returns:
+        Untrained FAISS IndexIVFPQ (inner product on unit vectors, i.e. cosine)
+    """
+    if nlist is None:
+        nlist = max(int(4 * math.sqrt(expected_size)), 32)
+    quantizer = faiss.IndexFlatIP(dimension)
+    index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+    index.nprobe = max(1, nlist // 16)
+    _training_buffers[id(index)] = (index, faiss.IndexFlatIP(dimension), 39 * max(nlist, index.pq.ksub))
+    return index
+
+
+def _create_sq(
+    dimension: int,
+    qtype: int,
+    training_data: Optional[np.ndarray],
+    expected_size: Optional[int]
+) -> faiss.Index:
+    """Scalar-quantized flat (or HNSW, for large expected_size) index; see create_memory"""
+    if expected_size is not None and expected_size >= IVF_MIN_SIZE:
+        index = faiss.IndexHNSWSQ(dimension, qtype, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    else:
+        index = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+    
+    if training_data is not None and len(training_data) >= SQ_TRAIN_SIZE:
+        train = np.array(training_data, dtype=np.float32)
+        faiss.normalize_L2(train)
+        index.train(train)
+    else:
+        _training_buffers[id(index)] = (index, faiss.IndexFlatIP(dimension), SQ_TRAIN_SIZE)
     return index
 
 
-def add_to_memory(index: faiss.Index, embedding: np.ndarray, text: str, memory_texts: List[str]):
+def _create_hnsw(dimension: int) -> faiss.Index:
+    """HNSW: logarithmic graph walk instead of a full scan, vectors can be added anytime"""
+    index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def _unit_rows(vectors: np.ndarray, slot: str) -> np.ndarray:
+    """
+    vectors as unit-length float32 rows (2D, as FAISS requires)
+    
+    Written into this thread's staging buffer for slot instead of a fresh array;
+    FAISS copies what it keeps, so the buffer can be reused by the next call.
+    """
+    vectors = vectors.reshape(-1, vectors.shape[-1])
+    buffers = _staging.__dict__
+    rows = buffers.get(slot)
+    if rows is None or rows.shape != vectors.shape:
+        rows = buffers[slot] = np.empty(vectors.shape, dtype=np.float32)
+    np.copyto(rows, vectors, casting="unsafe")
+    faiss.normalize_L2(rows)
+    return rows
+
+
+def add_to_memory(
+    index: faiss.Index,
+    embedding: np.ndarray,
+    text: str,
+    memory_texts: Union[List[str], Dict[int, str]],
+    hnsw_threshold: Optional[int] = None
+) -> faiss.Index:
     """
     Add memory to FAISS index
     
@@ -29,51 +231,271 @@ def add_to_memory(index: faiss.Index, embedding: np.ndarray, text: str, memory_t
         index: FAISS index
         embedding: Vector (1D array)
         text: Corresponding text
-        memory_texts: Text list (will be modified, new text added)
+        memory_texts: Text list (will be modified, new text added), or for a
+                      with_ids index a dict, where the text is stored under
+                      the memory's new ID
+        hnsw_threshold: Once a flat index reaches this many vectors its contents
+                        are moved into a new HNSW index (e.g. HNSW_MIGRATE_SIZE;
+                        default None keeps the flat index). Callers that set it
+                        must use the returned index from then on
+    
+    Returns:
+        Index to use from now on (a new HNSW index after migration, else index)
     """
-    # FAISS requires 2D array
-    if embedding.ndim == 1:
-        embedding = embedding.reshape(1, -1)
+    if id(index) in _mapped_indexes:
+        raise ValueError("Index was loaded with mmap=True and is read-only; load it with mmap=False to add memories")
+    
+    if isinstance(memory_texts, dict):
+        # ID-mapped index: texts are keyed by external ID, not by position
+        rows = _unit_rows(embedding, "add")
+        ids = np.fromiter((next(_memory_ids) for _ in range(len(rows))), dtype=np.int64, count=len(rows))
+        index.add_with_ids(rows, ids)
+        memory_texts.update(dict.fromkeys(ids.tolist(), text))
+        return index
+    
+    pending = _training_buffers.get(id(index))
+    if pending is not None:
+        # Not trained yet: collect vectors until there are enough to train on
+        _, buffer, train_size = pending
+        buffer.add(_unit_rows(embedding, "add"))
+        memory_texts.append(text)
+        if buffer.ntotal >= train_size:
+            vectors = buffer.reconstruct_n(0, buffer.ntotal)
+            index.train(vectors)
+            index.add(vectors)
+            del _training_buffers[id(index)]
+        return index
     
-    # Add to index
-    index.add(embedding.astype('float32'))
+    # Add to index (normalized, so inner product = cosine)
+    index.add(_unit_rows(embedding, "add"))
     
     # Add to text list
     memory_texts.append(text)
+    
+    # Flat search is fine for small memories; switch to HNSW as it grows
+    if hnsw_threshold is not None and type(index) is faiss.IndexFlatIP and index.ntotal >= hnsw_threshold:
+        hnsw = _create_hnsw(index.d)
+        hnsw.add(index.reconstruct_n(0, index.ntotal))
+        index = hnsw
+    
+    return index
 
 
-def search_memory(index: faiss.Index, query_embedding: np.ndarray, memory_texts: List[str], top_k: int = 3) -> List[Tuple[str, float]]:
+def remove_from_memory(index: faiss.Index, ids: Iterable[int], memory_texts: Dict[int, str]) -> int:
+    """
+    Remove memories from a create_memory(with_ids=True) index
+    
+    Args:
+        index: ID-mapped FAISS index
+        ids: IDs of the memories to remove (keys of memory_texts)
+        memory_texts: Text dict (will be modified, removed texts dropped)
+    
+    Returns:
+        Number of memories removed
+    """
+    ids = np.fromiter(ids, dtype=np.int64)
+    removed = index.remove_ids(faiss.IDSelectorBatch(ids))
+    for memory_id in ids.tolist():
+        memory_texts.pop(memory_id, None)
+    return removed
+
+
+def search_memory(index: faiss.Index, query_embedding: np.ndarray, memory_texts: Union[List[str], Dict[int, str]], top_k: int = 3) -> List[Tuple[str, float]]:
     """
     Retrieve relevant memories from FAISS
     
     Args:
         index: FAISS index
         query_embedding: Query vector
-        memory_texts: Text list
+        memory_texts: Text list (dict for with_ids indexes)
         top_k: Return top-k results
     
     Returns:
-        [(text, distance), ...] sorted by distance
+        [(text, similarity), ...] sorted by cosine similarity, highest first
+    """
+    return search_memory_batch(index, query_embedding, memory_texts, top_k)[0]
+
+
+def search_memory_batch(index: faiss.Index, queries: np.ndarray, memory_texts: Union[List[str], Dict[int, str]], top_k: int = 3) -> List[List[Tuple[str, float]]]:
+    """
+    Retrieve relevant memories for several queries with one FAISS call
+    
+    Args:
+        index: FAISS index
+        queries: Query vectors, shape (N, D) (or a single (D,) vector)
+        memory_texts: Text list (dict for with_ids indexes)
+        top_k: Return top-k results per query
+    
+    Returns:
+        One search_memory-style result list per query
     """
-    # If index is empty, return empty list
+    num_queries = 1 if queries.ndim == 1 else len(queries)
+    
+    # Untrained index: search the vectors buffered for training instead
+    pending = _training_buffers.get(id(index))
+    if pending is not None:
+        index = pending[1]
+    
+    # If index is empty, return empty lists
     if index.ntotal == 0:
+        return [[] for _ in range(num_queries)]
+    
+    # Search all queries at once
+    k = min(top_k, index.ntotal)  # Cannot exceed total number in index
+    similarities, indices = index.search(_unit_rows(queries, "query"), k)
+    
+    if isinstance(memory_texts, dict):
+        # ID-mapped index: results are external IDs, -1 pads missing results
+        return [
+            [(memory_texts[i], sim) for sim, i in zip(sims, idxs) if i != -1]
+            for sims, idxs in zip(similarities.tolist(), indices.tolist())
+        ]
+    
+    # Construct results, keeping only valid indices (IVF pads with -1)
+    valid = (indices >= 0) & (indices < len(memory_texts))
+    batch_results = []
+    for row_valid, sims, idxs in zip(valid, similarities, indices):
+        batch_results.append(list(zip(map(memory_texts.__getitem__, idxs[row_valid].tolist()), sims[row_valid].tolist())))
+    
+    return batch_results
+
+
+def search_memory_many(
+    index: faiss.Index,
+    queries_per_user: List[np.ndarray],
+    memory_texts: Union[List[str], Dict[int, str]],
+    top_k: int = 3
+) -> List[List[List[Tuple[str, float]]]]:
+    """
+    Run several users' query batches concurrently, one thread per user
+    
+    FAISS releases the GIL while searching, so the searches run in parallel.
+    
+    Args:
+        index: FAISS index
+        queries_per_user: One query matrix (or single vector) per user
+        memory_texts: Text list (dict for with_ids indexes)
+        top_k: Return top-k results per query
+    
+    Returns:
+        One search_memory_batch result per user
+    """
+    if not queries_per_user:
         return []
     
-    # FAISS requires 2D array
-    if query_embedding.ndim == 1:
-        query_embedding = query_embedding.reshape(1, -1)
+    workers = min(len(queries_per_user), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda queries: search_memory_batch(index, queries, memory_texts, top_k), queries_per_user))
+
+
+def tune_memory(
+    index: faiss.Index,
+    sample_queries: np.ndarray,
+    target_ms: float,
+    ground_truth: Optional[np.ndarray] = None
+) -> str:
+    """
+    Pick the search parameters (efSearch for HNSW, nprobe for IVF) for a latency budget
+    
+    Runs FAISS's ParameterSpace autotuner over the sample queries and applies the
+    most accurate operating point whose average latency fits target_ms (the
+    fastest one if none does).
     
-    # Search
-    k = min(top_k, index.ntotal)  # Cannot exceed total number in index
-    distances, indices = index.search(query_embedding.astype('float32'), k)
+    Args:
+        index: FAISS index with tunable search parameters
+        sample_queries: Representative query vectors, shape (N, D)
+        target_ms: Latency budget per query in milliseconds
+        ground_truth: Exact nearest neighbor IDs of the queries, shape (N, 1).
+                      Computed by exact search over the index's vectors if None
+    
+    Returns:
+        Chosen parameter string (e.g. "efSearch=32")
+    """
+    queries = np.array(sample_queries, dtype=np.float32).reshape(-1, index.d)
+    faiss.normalize_L2(queries)
+    
+    if ground_truth is None:
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()  # IVF needs it for reconstruct_n
+        exact = faiss.IndexFlatIP(index.d)
+        exact.add(index.reconstruct_n(0, index.ntotal))
+        _, ground_truth = exact.search(queries, 1)
+    
+    params = faiss.ParameterSpace()
+    params.initialize(index)
+    params.verbose = 0
+    criterion = faiss.OneRecallAtRCriterion(len(queries), 1)
+    criterion.set_groundtruth(None, np.ascontiguousarray(ground_truth[:, :1], dtype=np.int64))
+    explored = params.explore(index, queries, criterion)  # keep alive: optimal_pts points into it
+    points = explored.optimal_pts
+    
+    # Operating points are sorted by time; keep the last (most accurate) that fits
+    candidates = [points.at(i) for i in range(points.size()) if points.at(i).key]
+    chosen = candidates[0]
+    for point in candidates:
+        if point.t * 1000.0 / len(queries) <= target_ms:
+            chosen = point
+    
+    params.set_index_parameters(index, chosen.key)
+    return chosen.key
+
+
+def save_memory(index: faiss.Index, memory_texts: Union[List[str], Dict[int, str]], path: str):
+    """
+    Save a memory index and its texts to disk
+    
+    Writes path + ".faiss" (FAISS index) and path + ".texts.json" (texts).
+    An index that is still collecting training vectors is saved as the
+    flat index holding those vectors.
+    
+    Args:
+        index: FAISS index (a GPU index is copied back to the CPU first)
+        memory_texts: Text list (dict for with_ids indexes)
+        path: Output path prefix
+    """
+    pending = _training_buffers.get(id(index))
+    if pending is not None:
+        index = pending[1]
+    if _num_gpus() > 0 and type(index).__name__.startswith("Gpu"):
+        index = faiss.index_gpu_to_cpu(index)
+    
+    faiss.write_index(index, path + ".faiss")
+    with open(path + ".texts.json", "w", encoding="utf-8") as f:
+        json.dump(memory_texts, f, ensure_ascii=False)
+
+
+def load_memory(path: str, mmap: bool = True) -> Tuple[faiss.Index, Union[List[str], Dict[int, str]]]:
+    """
+    Load a memory index and its texts saved by save_memory
+    
+    Args:
+        path: Path prefix passed to save_memory
+        mmap: Memory-map the stored vectors instead of reading them into RAM.
+              Pages are loaded on demand and shared between processes that map
+              the same file, but the index is read-only (search only)
+    
+    Returns:
+        (index, memory_texts)
+    """
+    if mmap:
+        # IO_FLAG_MMAP_IFC also maps flat/HNSW vector storage, not just IVF lists
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(path + ".faiss", flags)
+        _mapped_indexes[id(index)] = index
+    else:
+        index = faiss.read_index(path + ".faiss")
+    
+    with open(path + ".texts.json", "r", encoding="utf-8") as f:
+        memory_texts = json.load(f)
     
-    # Construct results
-    results = []
-    for dist, idx in zip(distances[0], indices[0]):
-        if idx < len(memory_texts):  # Ensure valid index
-            results.append((memory_texts[idx], float(dist)))
+    if isinstance(memory_texts, dict):
+        # with_ids memory: JSON keys are strings, and new IDs must not reuse saved ones
+        global _memory_ids
+        memory_texts = {int(k): v for k, v in memory_texts.items()}
+        if memory_texts:
+            _memory_ids = itertools.count(max(max(memory_texts) + 1, next(_memory_ids)))
     
-    return results
+    return index, memory_texts
 
 
 if __name__ == "__main__":
@@ -97,7 +519,7 @@ if __name__ == "__main__":
     print(f"\nAdding {len(memories)} memories...")
     embeddings = get_embeddings_batch(memories)
     for emb, text in zip(embeddings, memories):
-        add_to_memory(index, emb, text, memory_texts)
+        index = add_to_memory(index, emb, text, memory_texts)
     
     print(f"Total memories: {index.ntotal}")
     
@@ -113,6 +535,6 @@ if __name__ == "__main__":
         query_emb = get_embedding(query)
         results = search_memory(index, query_emb, memory_texts, top_k=2)
         
-        for i, (text, dist) in enumerate(results, 1):
-            print(f"  {i}. (distance={dist:.3f}) {text}")
+        for i, (text, sim) in enumerate(results, 1):
+            print(f"  {i}. (similarity={sim:.3f}) {text}")
 
@@ -8,15 +8,28 @@ between different perception implementations:
 - UnityCameraPerception: Unity camera extraction package integration (Agent-controlled screenshots)
 """
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict, defaultdict, deque
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import time
 import json
 from pathlib import Path
 import glob
+import itertools
 import platform
 import math
+import sys
+import threading
+
+try:
+    import numba
+except ImportError:  # pragma: no cover
+    numba = None
 
 IS_WINDOWS = platform.system() == "Windows"
 
@@ -30,6 +43,29 @@ try:
 except Exception:
     pydirectinput = None
 
+try:
+    import orjson
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    orjson = None
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+try:
+    import mss  # type: ignore
+    from PIL import Image  # type: ignore
+except Exception:
+    mss = None  # screenshots fall back to pyautogui
+
 try:
     from .config_loader import get_config_value
 except ImportError:
@@ -193,6 +229,12 @@ class PerceptionInterface(ABC):
     All perception implementations must inherit from this class and implement its methods
     """
     
+    # Empty, so subclasses may declare __slots__ (those that don't still get a __dict__)
+    __slots__ = ()
+    
+    # Same as get_environment_info()["type"], readable without building the info dict
+    perception_type: str = ""
+    
     @abstractmethod
     def get_visible_objects(self, agent_id: str, position: Any) -> List[str]:
         """
@@ -253,6 +295,193 @@ class PerceptionInterface(ABC):
     def poll_messages(self, agent_id: str) -> List[Dict[str, Any]]:
         raise NotImplementedError
 
+    # Batched variants for callers that tick several agents; the defaults just loop
+    def poll_messages_batch(self, agent_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        return {agent_id: self.poll_messages(agent_id) for agent_id in agent_ids}
+
+    def execute_action_batch(self, actions: List[Tuple[str, str, Optional[Dict]]]) -> Dict[str, Dict[str, Any]]:
+        return {agent_id: self.execute_action(agent_id, action, params) for agent_id, action, params in actions}
+
+
+# Incoming messages are received by a background long-poll per agent (the server
+# holds each /messages/poll up to LONG_POLL_WAIT seconds); MESSAGE_LONG_POLL=0
+# goes back to one request per poll_messages call
+LONG_POLL = os.getenv("MESSAGE_LONG_POLL", "1") == "1"
+LONG_POLL_WAIT = 25.0
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Separate connect/read timeouts (seconds) for messaging requests: an unreachable
+# server fails within the connect timeout instead of holding the tick for the full read timeout
+CONNECT_TIMEOUT = float(os.getenv("ENV_SERVER_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.getenv("ENV_SERVER_READ_TIMEOUT", "8"))
+
+
+def _create_http_session() -> requests.Session:
+    """
+    requests.Session with a keep-alive connection pool
+    
+    Connection errors and 502/503/504 responses are retried with exponential
+    backoff (POSTs only on connection errors, since a POST that reached the
+    server may have been processed: a repeated send would deliver twice and a
+    repeated poll would drop the drained messages).
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class _ServerMessaging:
+    """
+    Messaging via the centralized messaging server (FastAPI env_server)
+    
+    Mixed into the Unity perceptions. All requests go through one pooled
+    keep-alive session per instance, and per-agent fan-out runs on a thread
+    pool of PERCEPTION_HTTP_WORKERS threads; close() (or a with block) releases both.
+    
+    With LONG_POLL, the first poll_messages for an agent starts a listener
+    thread that keeps a long-poll open and queues arrivals locally, so later
+    poll_messages calls return the queue without a request.
+    """
+    
+    def _init_messaging(self, messaging_base_url: Optional[str]):
+        # Optional centralized messaging server
+        # Priority: parameter > environment variable > config file
+        self.messaging_base_url = (messaging_base_url or os.getenv("ENV_SERVER_URL") or get_config_value("env_server_url") or "").rstrip("/")
+        self._session = _create_http_session()
+        self._pool = ThreadPoolExecutor(max_workers=int(os.getenv("PERCEPTION_HTTP_WORKERS", "8")))
+        self._has_poll_batch = True  # cleared if the server lacks /messages/poll_batch
+        self._inboxes: Dict[str, deque] = {}  # agent_id -> messages received by its listener
+        self._inbox_lock = threading.Lock()
+        self._closed = False
+    
+    def _require_messaging(self):
+        if not self.messaging_base_url:
+            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
+    
+    def _post_json(self, path: str, payload: Dict[str, Any], allow_404: bool = False, read_timeout: float = READ_TIMEOUT) -> Optional[Dict[str, Any]]:
+        """POST payload to the messaging server and return the JSON reply (None on an allowed 404)"""
+        self._require_messaging()
+        resp = self._session.post(
+            f"{self.messaging_base_url}{path}", data=_dumps(payload), headers=_JSON_HEADERS,
+            timeout=(CONNECT_TIMEOUT, read_timeout),
+        )
+        if allow_404 and resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return _loads(resp.content)
+    
+    def send_message(self, sender: str, recipient: str, message: str) -> None:
+        self._post_json("/messages/send", {"sender": sender, "recipient": recipient, "message": message})
+    
+    def poll_messages(self, agent_id: str) -> List[Dict[str, Any]]:
+        inbox = self._inboxes.get(agent_id)
+        if inbox is None:
+            data = self._post_json("/messages/poll", {"agent_id": agent_id})
+            if LONG_POLL:
+                self._start_listener(agent_id)
+            return data.get("messages", [])
+        
+        messages = []
+        while inbox:
+            messages.append(inbox.popleft())
+        return messages
+    
+    def _start_listener(self, agent_id: str):
+        with self._inbox_lock:
+            if agent_id in self._inboxes:
+                return
+            self._inboxes[agent_id] = deque()
+        threading.Thread(target=self._listen, args=(agent_id,), name=f"messages-{agent_id}", daemon=True).start()
+    
+    def _listen(self, agent_id: str):
+        """Keep a long-poll open for agent_id and queue whatever arrives"""
+        inbox = self._inboxes[agent_id]
+        while not self._closed:
+            started = time.monotonic()
+            try:
+                data = self._post_json("/messages/poll", {"agent_id": agent_id, "wait": LONG_POLL_WAIT}, read_timeout=LONG_POLL_WAIT + READ_TIMEOUT)
+                messages = data.get("messages", [])
+                inbox.extend(messages)
+            except Exception as e:
+                # Connection errors and unparsable replies alike: log, back off, keep
+                # listening (a dead listener would leave poll_messages returning [])
+                if self._closed:
+                    break
+                print(f"[Messaging] Long-poll for {agent_id} failed: {e}")
+                messages = []
+            # A server without long-poll support (or an error) returns at once; don't spin
+            if not messages and time.monotonic() - started < 1.0:
+                time.sleep(1.0)
+    
+    def poll_messages_many(self, agent_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Poll several agents concurrently, one /messages/poll request each"""
+        return dict(zip(agent_ids, self._pool.map(self.poll_messages, agent_ids)))
+    
+    def poll_messages_batch(self, agent_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Poll several agents' mailboxes with one request (one per agent on older servers)"""
+        if LONG_POLL:
+            # Listeners own the server mailboxes; polling them here would race
+            return {agent_id: self.poll_messages(agent_id) for agent_id in agent_ids}
+        if self._has_poll_batch:
+            data = self._post_json("/messages/poll_batch", {"agents": list(agent_ids)}, allow_404=True)
+            if data is not None:
+                return data.get("messages", {})
+            self._has_poll_batch = False
+        
+        return self.poll_messages_many(agent_ids)
+    
+    def close(self):
+        """Close pooled HTTP connections, the fan-out thread pool and message listeners"""
+        self._closed = True
+        self._pool.shutdown(wait=False)
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Position change per mock action; unknown actions stay in place
+_ACTION_DELTA = {"forward": 1, "backward": -1}
+# Action codes for the bulk stepping kernel (anything else is 2 = stay)
+_ACTION_CODE = {"forward": 0, "backward": 1}
+_CODE_DELTA = np.array([1, -1, 0], dtype=np.int64)
+# Trajectories kept by MockPerception.execute_trajectory (least recently used dropped first)
+TRAJECTORY_CACHE_SIZE = 1000
+
+
+def _step_positions_py(positions: np.ndarray, slots: np.ndarray, codes: np.ndarray, max_pos: int) -> np.ndarray:
+    """
+    Apply actions in order: step i moves agent slots[i] by codes[i], clipped to [0, max_pos]
+    
+    Args:
+        positions: Current position per agent slot (updated in place)
+        slots: Agent slot of each action
+        codes: int8 action code of each action
+        max_pos: Last valid position
+    
+    Returns:
+        Position of each action's agent after its step
+    """
+    out = np.empty(len(slots), dtype=np.int64)
+    for i in range(len(slots)):
+        p = min(max(positions[slots[i]] + _CODE_DELTA[codes[i]], 0), max_pos)
+        positions[slots[i]] = p
+        out[i] = p
+    return out
+
+
+# Compiled when numba is installed (one tight loop over the int arrays);
+# the pure-Python loop above is the fallback
+_step_positions = numba.njit(cache=True)(_step_positions_py) if numba is not None else _step_positions_py
+
 
 class MockPerception(PerceptionInterface):
     """
@@ -261,20 +490,82 @@ class MockPerception(PerceptionInterface):
     Uses simple dictionary data structures to simulate XR environment, for development and testing
     """
     
+    perception_type = "mock"
+    
+    __slots__ = (
+        "env", "_total_objects", "_max_pos", "_agent_positions", "_objects",
+        "_explored", "_moves", "_stay", "_traj_cache",
+    )
+    
     def __init__(self, env: Dict[str, Any]):
         """
         Args:
             env: Environment dictionary containing objects, agent_positions, etc.
         """
         self.env = env
+        # Immutable tuples of interned names, returned as-is by get_visible_objects
+        env["objects"] = {
+            pos: tuple(map(sys.intern, objs)) for pos, objs in env["objects"].items()
+        }
+        # Object count for get_environment_info; reset to None if env["objects"] changes
+        self._total_objects = None
+        # Hoisted env entries used on every execute_action (the containers are shared with env)
+        self._max_pos = env["num_positions"] - 1
+        # Unknown agents start at position 0, so lookups are a single subscript
+        if not isinstance(env["agent_positions"], defaultdict):
+            env["agent_positions"] = defaultdict(int, env["agent_positions"])
+        self._agent_positions = env["agent_positions"]
+        self._objects = env["objects"]
+        self._explored = env["explored_by_all"]
+        # Precomputed transitions: action -> {position: next position}, so a step
+        # is two dict lookups; _stay covers unknown actions
+        positions = range(self._max_pos + 1)
+        self._moves = {
+            action: {pos: max(0, min(self._max_pos, pos + delta)) for pos in positions}
+            for action, delta in _ACTION_DELTA.items()
+        }
+        self._stay = {pos: pos for pos in positions}
+        # (start position, actions) -> (final position, objects seen), LRU-bounded;
+        # see execute_trajectory
+        self._traj_cache: "OrderedDict[Tuple[int, Tuple[str, ...]], Tuple[int, frozenset]]" = OrderedDict()
     
-    def get_visible_objects(self, agent_id: str, position: Any) -> List[str]:
-        """Get visible objects from simulated environment"""
-        return self.env["objects"].get(position, [])
+    def get_visible_objects(self, agent_id: str, position: Any) -> Tuple[str, ...]:
+        """Get visible objects from simulated environment (shared tuple, do not copy)"""
+        return self._objects.get(position, ())
+    
+    def invalidate_visible(self, position: Any = None):
+        """
+        Re-read env["objects"] after an external write
+        
+        get_visible_objects returns the stored tuples without copying, so code
+        that writes env["objects"][position] directly calls this afterwards.
+        
+        Args:
+            position: Position that changed (None: all positions)
+        """
+        positions = self._objects.keys() if position is None else [position]
+        for pos in positions:
+            if pos in self._objects:
+                self._objects[pos] = tuple(map(sys.intern, self._objects[pos]))
+        self._total_objects = None
+        self._traj_cache.clear()
+    
+    def add_object(self, position: Any, name: str):
+        """
+        Place an object at a position, keeping the cached object count in step
+        
+        Args:
+            position: Position index
+            name: Object name
+        """
+        self._objects[position] = self._objects.get(position, ()) + (sys.intern(name),)
+        if self._total_objects is not None:
+            self._total_objects += 1
+        self._traj_cache.clear()
     
     def get_agent_state(self, agent_id: str) -> Dict[str, Any]:
         """Get agent state"""
-        position = self.env["agent_positions"].get(agent_id, 0)
+        position = self._agent_positions[agent_id]
         return {
             "position": position,
             "rotation": 0,  # Mock environment doesn't support rotation yet
@@ -289,21 +580,18 @@ class MockPerception(PerceptionInterface):
         - "forward": Move forward
         - "backward": Move backward
         """
-        current_pos = self.env["agent_positions"].get(agent_id, 0)
-        
-        if action == "forward":
-            new_pos = min(current_pos + 1, self.env["num_positions"] - 1)
-        elif action == "backward":
-            new_pos = max(current_pos - 1, 0)
-        else:
-            new_pos = current_pos  # Unknown action, stay in place
+        current_pos = self._agent_positions[agent_id]
+        new_pos = self._moves.get(action, self._stay).get(current_pos)
+        if new_pos is None:
+            # Position set from outside the valid range
+            new_pos = max(0, min(self._max_pos, current_pos + _ACTION_DELTA.get(action, 0)))
         
         # Update position
-        self.env["agent_positions"][agent_id] = new_pos
+        self._agent_positions[agent_id] = new_pos
         
         # Update global exploration record
-        visible = self.get_visible_objects(agent_id, new_pos)
-        self.env["explored_by_all"].update(visible)
+        visible = self._objects.get(new_pos, ())
+        self._explored.update(visible)
         
         return {
             "position": new_pos,
@@ -312,13 +600,103 @@ class MockPerception(PerceptionInterface):
             "visible_objects": visible
         }
     
+    def execute_actions_bulk(self, agent_ids: List[str], actions: List[str]) -> List[int]:
+        """
+        Execute many actions in one compiled step
+        
+        Actions are applied in order, so an agent listed twice moves twice.
+        
+        Args:
+            agent_ids: Agent of each action
+            actions: "forward" or "backward" for each agent (anything else stays)
+        
+        Returns:
+            New position after each action, in input order
+        """
+        slot_of: Dict[str, int] = {}
+        slots = np.fromiter((slot_of.setdefault(a, len(slot_of)) for a in agent_ids), dtype=np.int64, count=len(agent_ids))
+        codes = np.fromiter((_ACTION_CODE.get(a, 2) for a in actions), dtype=np.int8, count=len(actions))
+        positions = np.fromiter((self._agent_positions[a] for a in slot_of), dtype=np.int64, count=len(slot_of))
+        
+        new_positions = _step_positions(positions, slots, codes, self._max_pos).tolist()
+        
+        self._agent_positions.update(zip(slot_of, positions.tolist()))
+        for pos in set(new_positions):
+            self._explored.update(self._objects.get(pos, ()))
+        return new_positions
+    
+    def execute_action_batch(self, actions: List[Tuple[str, str, Optional[Dict]]]) -> Dict[str, Dict[str, Any]]:
+        agent_ids = [agent_id for agent_id, _, _ in actions]
+        new_positions = self.execute_actions_bulk(agent_ids, [action for _, action, _ in actions])
+        return {
+            agent_id: {
+                "position": pos,
+                "rotation": 0,
+                "velocity": 0,
+                "visible_objects": self._objects.get(pos, ())
+            }
+            for agent_id, pos in zip(agent_ids, new_positions)
+        }
+    
+    def execute_trajectory(self, agent_id: str, actions: List[str]) -> Dict[str, Any]:
+        """
+        Execute a sequence of actions for one agent, reusing earlier identical runs
+        
+        Rollouts that restart from the same position replay the same action
+        prefixes; the (final position, objects seen) result of each trajectory
+        is cached, and a trajectory one action longer than a cached one only
+        computes its last step.
+        
+        Args:
+            agent_id: Agent identifier
+            actions: Actions in order ("forward"/"backward"; anything else stays)
+        
+        Returns:
+            Final state, as from execute_action, plus "seen_objects": every object
+            visible along the way
+        """
+        start = self._agent_positions[agent_id]
+        key = (start, tuple(actions))
+        cached = self._traj_cache.get(key)
+        if cached is not None:
+            self._traj_cache.move_to_end(key)
+            final_pos, seen = cached
+        else:
+            prefix = self._traj_cache.get((start, key[1][:-1])) if actions else None
+            if prefix is not None:
+                pos, seen = prefix
+                todo = key[1][-1:]
+                seen = set(seen)
+            else:
+                pos, seen, todo = start, set(), key[1]
+            for action in todo:
+                nxt = self._moves.get(action, self._stay).get(pos)
+                pos = max(0, min(self._max_pos, pos + _ACTION_DELTA.get(action, 0))) if nxt is None else nxt
+                seen.update(self._objects.get(pos, ()))
+            final_pos, seen = pos, frozenset(seen)
+            self._traj_cache[key] = (final_pos, seen)
+            if len(self._traj_cache) > TRAJECTORY_CACHE_SIZE:
+                self._traj_cache.popitem(last=False)
+        
+        self._agent_positions[agent_id] = final_pos
+        self._explored.update(seen)
+        return {
+            "position": final_pos,
+            "rotation": 0,
+            "velocity": 0,
+            "visible_objects": self._objects.get(final_pos, ()),
+            "seen_objects": seen,
+        }
+    
     def get_environment_info(self) -> Dict[str, Any]:
         """Get environment information"""
+        if self._total_objects is None:
+            self._total_objects = sum(map(len, self.env["objects"].values()))
         return {
-            "type": "mock",
-            "num_positions": self.env["num_positions"],
-            "total_objects": sum(len(objs) for objs in self.env["objects"].values()),
-            "boundaries": {"min": 0, "max": self.env["num_positions"] - 1}
+            "type": self.perception_type,
+            "num_positions": self._max_pos + 1,
+            "total_objects": self._total_objects,
+            "boundaries": {"min": 0, "max": self._max_pos}
         }
 
 
@@ -329,6 +707,10 @@ class XRPerception(PerceptionInterface):
     This is a template class that needs to be filled based on actual XR platform
     """
     
+    perception_type = "xr"
+    
+    __slots__ = ("xr_client", "config")
+    
     def __init__(self, xr_client=None, config: Optional[Dict] = None):
         """
         Args:
@@ -430,7 +812,34 @@ class XRPerception(PerceptionInterface):
         )
 
 
-class UnityPyAutoGUIPerception(PerceptionInterface):
+# Keyboard key per movement action, looked up once per execute_action
+# (Unity3DPerception only supports the WSAD subset)
+_ACTION_KEYS: Dict[str, str] = {
+    "forward": "w",
+    "backward": "s",
+    "move_left": "a",
+    "move_right": "d",
+    "move_up": "r",
+    "move_down": "f",
+    "look_left": "left",
+    "look_right": "right",
+    "look_up": "up",
+    "look_down": "down",
+    "tilt_left": "q",
+    "tilt_right": "e",
+}
+_WSAD_KEYS: Dict[str, str] = {action: _ACTION_KEYS[action] for action in ("forward", "backward", "move_left", "move_right")}
+
+# Pillow save() arguments per screenshot format, tuned for encode speed
+# (PNG compress_level=1 is a few times faster than the default 6)
+_SCREENSHOT_SAVE_ARGS = {
+    "jpg": {"format": "JPEG", "optimize": False},
+    "webp": {"format": "WEBP", "method": 0},
+    "png": {"format": "PNG", "compress_level": 1},
+}
+
+
+class UnityPyAutoGUIPerception(_ServerMessaging, PerceptionInterface):
     """
     Perception implementation that interacts with a running Unity game window via pyautogui.
 
@@ -454,6 +863,8 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
     Note: Ensure the Unity window has focus when running. This class does not switch focus.
     """
 
+    perception_type = "unity"
+
     def __init__(
         self,
         screenshot_dir: Optional[str] = None,
@@ -461,9 +872,15 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
         keymap: Optional[Dict[str, str]] = None,
         press_time: float = 0.3,
         messaging_base_url: Optional[str] = None,
+        capture_ttl: float = 0.05,
+        async_save: bool = False,
+        screenshot_format: str = "jpg",
+        screenshot_quality: int = 85,
     ):
         if pyautogui is None:
             raise RuntimeError("pyautogui is not installed. Please `pip install pyautogui`.")
+        if screenshot_format not in _SCREENSHOT_SAVE_ARGS:
+            raise ValueError(f"Unsupported screenshot_format {screenshot_format!r}; use one of {sorted(_SCREENSHOT_SAVE_ARGS)}")
 
         self.capture_region = capture_region
         self.press_time = press_time
@@ -472,22 +889,77 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
         base_dir = Path(screenshot_dir) if screenshot_dir else Path.cwd() / "screenshots"
         base_dir.mkdir(parents=True, exist_ok=True)
         self.screenshot_dir = base_dir
-        # Optional centralized messaging server (FastAPI env_server)
-        # Priority: parameter > environment variable > config file
-        self.messaging_base_url = (messaging_base_url or os.getenv("ENV_SERVER_URL") or get_config_value("env_server_url") or "").rstrip("/")
+        # Screenshot names: run date (formatted once), capture time in ns, then a
+        # per-instance sequence number that keeps names unique and ordered
+        self._date_prefix = time.strftime("%Y%m%d")
+        self._capture_counter = itertools.count()
+        # get_visible_objects calls within capture_ttl seconds of the agent's last
+        # capture (and with no action in between) reuse it; 0 disables
+        self.capture_ttl = capture_ttl
+        self._last_capture: Dict[str, Tuple[float, Tuple[str, ...]]] = {}
+        # With async_save, image encoding and the disk write run on _io_pool and
+        # _capture returns the path at once; only for callers that read the file
+        # later (PerceptionNode reads it immediately, so the default is False)
+        self.async_save = async_save
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot-save") if async_save else None
+        self._pending_saves: deque = deque()
+        # JPEG/WEBP encode several times faster than PNG and are far smaller;
+        # PNG (lossless) is kept for debugging
+        self.screenshot_format = screenshot_format
+        self._save_kwargs = dict(_SCREENSHOT_SAVE_ARGS[screenshot_format])
+        if screenshot_format != "png":
+            self._save_kwargs["quality"] = screenshot_quality
+        # mss keeps the OS capture handle open between grabs (pyautogui sets one up
+        # per call); its handles are thread-bound, so each thread gets its own
+        self._sct_local = threading.local()
+        if capture_region:
+            left, top, width, height = capture_region
+            self._monitor = {"left": left, "top": top, "width": width, "height": height}
+        else:
+            self._monitor = None  # primary monitor, resolved on first grab
+        self._init_messaging(messaging_base_url)
+
+    def _grab(self):
+        """Screenshot of capture_region (or the primary screen) as a PIL image"""
+        if mss is None:
+            return pyautogui.screenshot(region=self.capture_region) if self.capture_region else pyautogui.screenshot()
+        sct = getattr(self._sct_local, "sct", None)
+        if sct is None:
+            sct = self._sct_local.sct = mss.mss()
+        raw = sct.grab(self._monitor or sct.monitors[1])
+        return Image.frombytes("RGB", raw.size, raw.rgb)
 
     def _capture(self, agent_id: str) -> str:
-        ts = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"{agent_id}_{ts}_{int(time.time()*1000)%1000:03d}.png"
+        filename = f"{agent_id}_{self._date_prefix}_{time.time_ns()}_{next(self._capture_counter):06d}.{self.screenshot_format}"
         path = self.screenshot_dir / filename
 
-        img = pyautogui.screenshot(region=self.capture_region) if self.capture_region else pyautogui.screenshot()
-        img.save(path)
+        img = self._grab()
+        if self.screenshot_format != "png" and img.mode != "RGB":
+            img = img.convert("RGB")  # JPEG has no alpha channel
+        if self._io_pool is None:
+            img.save(path, **self._save_kwargs)
+        else:
+            while self._pending_saves and self._pending_saves[0].done():
+                self._pending_saves.popleft()
+            self._pending_saves.append(self._io_pool.submit(img.save, path, **self._save_kwargs))
         return str(path)
-
-    def get_visible_objects(self, agent_id: str, position: Any) -> List[str]:
-        path = self._capture(agent_id)
-        return [f"screenshot:{path}"]
+    
+    def close(self):
+        """Finish pending screenshot saves, then release messaging resources"""
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
+            self._pending_saves.clear()
+        super().close()
+
+    def get_visible_objects(self, agent_id: str, position: Any) -> Tuple[str, ...]:
+        """Capture a screenshot; returns ("screenshot:<path>",), shared with reuses of the capture"""
+        now = time.monotonic()
+        last = self._last_capture.get(agent_id)
+        if last is not None and now - last[0] < self.capture_ttl:
+            return last[1]
+        visible = ("screenshot:" + self._capture(agent_id),)
+        self._last_capture[agent_id] = (now, visible)
+        return visible
 
     def get_agent_state(self, agent_id: str) -> Dict[str, Any]:
         return {
@@ -497,6 +969,7 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
         }
 
     def execute_action(self, agent_id: str, action: str, params: Optional[Dict] = None) -> Dict[str, Any]:
+        self._last_capture.pop(agent_id, None)  # the view is about to change
         self._perform_movement_action(action)
 
         # Update logical step counter
@@ -509,26 +982,12 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
             "position": self.agent_steps[agent_id],
             "rotation": None,
             "velocity": None,
-            "visible_objects": [],  # Will be updated in next PerceptionNode
+            "visible_objects": (),  # Will be updated in next PerceptionNode
         }
 
     def _perform_movement_action(self, action: str) -> None:
         """Encapsulated movement action handler with internal key mapping (no env vars)."""
-        mapping: Dict[str, str] = {
-            "forward": "w",
-            "backward": "s",
-            "move_left": "a",
-            "move_right": "d",
-            "move_up": "r",
-            "move_down": "f",
-            "look_left": "left",
-            "look_right": "right",
-            "look_up": "up",
-            "look_down": "down",
-            "tilt_left": "q",
-            "tilt_right": "e",
-        }
-        key = mapping.get(action)
+        key = _ACTION_KEYS.get(action)
         if not key:
             return
         try:
@@ -539,28 +998,13 @@ class UnityPyAutoGUIPerception(PerceptionInterface):
 
     def get_environment_info(self) -> Dict[str, Any]:
         return {
-            "type": "unity",
+            "type": self.perception_type,
             "screenshot_dir": str(self.screenshot_dir),
             "capture_region": self.capture_region,
         }
 
-    # Messaging via centralized server when configured
-    def send_message(self, sender: str, recipient: str, message: str) -> None:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(f"{self.messaging_base_url}/messages/send", json={"sender": sender, "recipient": recipient, "message": message}, timeout=10)
-        resp.raise_for_status()
-
-    def poll_messages(self, agent_id: str) -> List[Dict[str, Any]]:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(f"{self.messaging_base_url}/messages/poll", json={"agent_id": agent_id}, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("messages", [])
 
-
-class Unity3DPerception(PerceptionInterface):
+class Unity3DPerception(_ServerMessaging, PerceptionInterface):
     """
     Perception implementation for Unity3D with simplified action space.
     
@@ -578,6 +1022,8 @@ class Unity3DPerception(PerceptionInterface):
       - "move_right" -> 'd'
     """
 
+    perception_type = "unity3d"
+
     def __init__(
         self,
         unity_output_base_path: str,
@@ -612,9 +1058,7 @@ class Unity3DPerception(PerceptionInterface):
             self.agent_request_dir = self.unity_output_base_path / "agent_requests"
         self.agent_request_dir.mkdir(parents=True, exist_ok=True)
         
-        # Optional centralized messaging server
-        # Priority: parameter > environment variable > config file
-        self.messaging_base_url = (messaging_base_url or os.getenv("ENV_SERVER_URL") or get_config_value("env_server_url") or "").rstrip("/")
+        self._init_messaging(messaging_base_url)
         
         # Track last screenshot request time to detect new screenshots
         self._last_request_time: Dict[str, float] = {}
@@ -740,7 +1184,7 @@ class Unity3DPerception(PerceptionInterface):
             "position": self.agent_steps[agent_id],
             "rotation": None,
             "velocity": None,
-            "visible_objects": [],  # Will be updated in next PerceptionNode
+            "visible_objects": (),  # Will be updated in next PerceptionNode
         }
 
     def _perform_movement_action(self, action: str) -> None:
@@ -748,13 +1192,7 @@ class Unity3DPerception(PerceptionInterface):
         
         - On Windows: uses pydirectinput
         """
-        mapping: Dict[str, str] = {
-            "forward": "w",
-            "backward": "s",
-            "move_left": "a",
-            "move_right": "d",
-        }
-        key = mapping.get(action)
+        key = _WSAD_KEYS.get(action)
         if not key:
             print(f"[Unity3DPerception] Warning: Unknown action '{action}', skipping.")
             return
@@ -775,36 +1213,13 @@ class Unity3DPerception(PerceptionInterface):
 
     def get_environment_info(self) -> Dict[str, Any]:
         return {
-            "type": "unity3d",
+            "type": self.perception_type,
             "unity_output_base_path": str(self.unity_output_base_path),
             "agent_request_dir": str(self.agent_request_dir),
         }
 
-    # Messaging via centralized server when configured
-    def send_message(self, sender: str, recipient: str, message: str) -> None:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(
-            f"{self.messaging_base_url}/messages/send",
-            json={"sender": sender, "recipient": recipient, "message": message},
-            timeout=10
-        )
-        resp.raise_for_status()
 
-    def poll_messages(self, agent_id: str) -> List[Dict[str, Any]]:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(
-            f"{self.messaging_base_url}/messages/poll",
-            json={"agent_id": agent_id},
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("messages", [])
-
-
-class UnityCameraPerception(PerceptionInterface):
+class UnityCameraPerception(_ServerMessaging, PerceptionInterface):
     """
     Perception implementation that uses Unity camera extraction package for Agent-controlled screenshots.
     
@@ -828,6 +1243,8 @@ class UnityCameraPerception(PerceptionInterface):
       - "tilt_right" -> 'e'
     """
 
+    perception_type = "unity-camera"
+
     def __init__(
         self,
         unity_output_base_path: str,
@@ -859,9 +1276,7 @@ class UnityCameraPerception(PerceptionInterface):
             self.agent_request_dir = self.unity_output_base_path / "agent_requests"
         self.agent_request_dir.mkdir(parents=True, exist_ok=True)
         
-        # Optional centralized messaging server
-        # Priority: parameter > environment variable > config file
-        self.messaging_base_url = (messaging_base_url or os.getenv("ENV_SERVER_URL") or get_config_value("env_server_url") or "").rstrip("/")
+        self._init_messaging(messaging_base_url)
         
         # Track last screenshot request time to detect new screenshots
         self._last_request_time: Dict[str, float] = {}
@@ -965,26 +1380,12 @@ class UnityCameraPerception(PerceptionInterface):
             "position": self.agent_steps[agent_id],
             "rotation": None,
             "velocity": None,
-            "visible_objects": [],  # Will be updated in next PerceptionNode
+            "visible_objects": (),  # Will be updated in next PerceptionNode
         }
 
     def _perform_movement_action(self, action: str) -> None:
         """Encapsulated movement action handler with internal key mapping"""
-        mapping: Dict[str, str] = {
-            "forward": "w",
-            "backward": "s",
-            "move_left": "a",
-            "move_right": "d",
-            "move_up": "r",
-            "move_down": "f",
-            "look_left": "left",
-            "look_right": "right",
-            "look_up": "up",
-            "look_down": "down",
-            "tilt_left": "q",
-            "tilt_right": "e",
-        }
-        key = mapping.get(action)
+        key = _ACTION_KEYS.get(action)
         if not key:
             return
         try:
@@ -995,42 +1396,91 @@ class UnityCameraPerception(PerceptionInterface):
 
     def get_environment_info(self) -> Dict[str, Any]:
         return {
-            "type": "unity-camera",
+            "type": self.perception_type,
             "unity_output_base_path": str(self.unity_output_base_path),
             "agent_request_dir": str(self.agent_request_dir),
         }
 
-    # Messaging via centralized server when configured
-    def send_message(self, sender: str, recipient: str, message: str) -> None:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(
-            f"{self.messaging_base_url}/messages/send",
-            json={"sender": sender, "recipient": recipient, "message": message},
-            timeout=10
-        )
-        resp.raise_for_status()
 
-    def poll_messages(self, agent_id: str) -> List[Dict[str, Any]]:
-        if not self.messaging_base_url:
-            raise NotImplementedError("Messaging server not configured. Set ENV_SERVER_URL or pass messaging_base_url.")
-        resp = requests.post(
-            f"{self.messaging_base_url}/messages/poll",
-            json={"agent_id": agent_id},
-            timeout=10
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("messages", [])
+# Factory function: convenient for creating different perception implementations
+def _build_mock(kwargs: Dict[str, Any]) -> PerceptionInterface:
+    return MockPerception(kwargs.get("env"))
+
+
+def _build_xr(kwargs: Dict[str, Any]) -> PerceptionInterface:
+    return XRPerception(
+        xr_client=kwargs.get("xr_client"),
+        config=kwargs.get("config")
+    )
+
+
+def _build_unity(kwargs: Dict[str, Any]) -> PerceptionInterface:
+    return UnityPyAutoGUIPerception(
+        screenshot_dir=kwargs.get("screenshot_dir"),
+        capture_region=kwargs.get("capture_region"),
+        keymap=kwargs.get("keymap"),
+        press_time=kwargs.get("press_time", 0.3),
+        messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
+        screenshot_format=kwargs.get("screenshot_format", "jpg"),
+        screenshot_quality=kwargs.get("screenshot_quality", 85),
+    )
+
+
+def _build_unity3d(kwargs: Dict[str, Any]) -> PerceptionInterface:
+    # New simplified Unity3D perception mode (WSAD + Space only, no window focus required)
+    unity_output_base_path = kwargs.get("unity_output_base_path") or os.getenv("UNITY_OUTPUT_BASE_PATH")
+    if not unity_output_base_path:
+        raise ValueError("Unity3DPerception requires 'unity_output_base_path' or UNITY_OUTPUT_BASE_PATH")
+    return Unity3DPerception(
+        unity_output_base_path=unity_output_base_path,
+        agent_request_dir=kwargs.get("agent_request_dir") or os.getenv("AGENT_REQUEST_DIR"),
+        press_time=float(kwargs.get("press_time", os.getenv("STEP_SLEEP", "0.3"))),
+        screenshot_timeout=float(kwargs.get("screenshot_timeout", os.getenv("SCREENSHOT_TIMEOUT", "5.0"))),
+        messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
+    )
+
+
+def _build_unity_camera(kwargs: Dict[str, Any]) -> PerceptionInterface:
+    unity_output_base_path = kwargs.get("unity_output_base_path") or os.getenv("UNITY_OUTPUT_BASE_PATH")
+    if not unity_output_base_path:
+        raise ValueError("UnityCameraPerception requires 'unity_output_base_path' or UNITY_OUTPUT_BASE_PATH")
+    return UnityCameraPerception(
+        unity_output_base_path=unity_output_base_path,
+        agent_request_dir=kwargs.get("agent_request_dir") or os.getenv("AGENT_REQUEST_DIR"),
+        press_time=float(kwargs.get("press_time", os.getenv("STEP_SLEEP", "1.0"))),
+        screenshot_timeout=float(kwargs.get("screenshot_timeout", os.getenv("SCREENSHOT_TIMEOUT", "5.0"))),
+        messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
+    )
+
+
+# perception_type -> builder taking create_perception's kwargs as a dict
+_PERCEPTION_BUILDERS: Dict[str, Callable[[Dict[str, Any]], PerceptionInterface]] = {
+    "mock": _build_mock,
+    "xr": _build_xr,
+    "unity": _build_unity,
+    "unity3d": _build_unity3d,
+    "unity-camera": _build_unity_camera,
+}
+
+
+def register_perception(perception_type: str, builder: Callable[[Dict[str, Any]], PerceptionInterface]):
+    """
+    Make a perception backend available to create_perception
+    
+    Args:
+        perception_type: Name passed to create_perception (replaces an existing entry)
+        builder: Called with create_perception's keyword arguments as a dict
+    """
+    _PERCEPTION_BUILDERS[perception_type] = builder
 
 
-# Factory function: convenient for creating different perception implementations
 def create_perception(perception_type: str = "mock", **kwargs) -> PerceptionInterface:
     """
     Factory function for creating perception instances
     
     Args:
-        perception_type: Perception type ("mock", "xr", "unity", "unity-camera", or "unity3d")
+        perception_type: Perception type ("mock", "xr", "unity", "unity-camera", "unity3d",
+            or a name added with register_perception)
         **kwargs: Arguments passed to perception class constructor
     
     Returns:
@@ -1046,46 +1496,10 @@ def create_perception(perception_type: str = "mock", **kwargs) -> PerceptionInte
         # Create Unity3D perception (simplified action space)
         perception = create_perception("unity3d", unity_output_base_path="/path/to/output")
     """
-    if perception_type == "mock":
-        return MockPerception(kwargs.get("env"))
-    elif perception_type == "xr":
-        return XRPerception(
-            xr_client=kwargs.get("xr_client"),
-            config=kwargs.get("config")
-        )
-    elif perception_type == "unity":
-        return UnityPyAutoGUIPerception(
-            screenshot_dir=kwargs.get("screenshot_dir"),
-            capture_region=kwargs.get("capture_region"),
-            keymap=kwargs.get("keymap"),
-            press_time=kwargs.get("press_time", 0.3),
-            messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
-        )
-    elif perception_type == "unity3d":
-        # New simplified Unity3D perception mode (WSAD + Space only, no window focus required)
-        unity_output_base_path = kwargs.get("unity_output_base_path") or os.getenv("UNITY_OUTPUT_BASE_PATH")
-        if not unity_output_base_path:
-            raise ValueError("Unity3DPerception requires 'unity_output_base_path' or UNITY_OUTPUT_BASE_PATH")
-        return Unity3DPerception(
-            unity_output_base_path=unity_output_base_path,
-            agent_request_dir=kwargs.get("agent_request_dir") or os.getenv("AGENT_REQUEST_DIR"),
-            press_time=float(kwargs.get("press_time", os.getenv("STEP_SLEEP", "0.3"))),
-            screenshot_timeout=float(kwargs.get("screenshot_timeout", os.getenv("SCREENSHOT_TIMEOUT", "5.0"))),
-            messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
-        )
-    elif perception_type == "unity-camera":
-        unity_output_base_path = kwargs.get("unity_output_base_path") or os.getenv("UNITY_OUTPUT_BASE_PATH")
-        if not unity_output_base_path:
-            raise ValueError("UnityCameraPerception requires 'unity_output_base_path' or UNITY_OUTPUT_BASE_PATH")
-        return UnityCameraPerception(
-            unity_output_base_path=unity_output_base_path,
-            agent_request_dir=kwargs.get("agent_request_dir") or os.getenv("AGENT_REQUEST_DIR"),
-            press_time=float(kwargs.get("press_time", os.getenv("STEP_SLEEP", "1.0"))),
-            screenshot_timeout=float(kwargs.get("screenshot_timeout", os.getenv("SCREENSHOT_TIMEOUT", "5.0"))),
-            messaging_base_url=kwargs.get("messaging_base_url") or os.getenv("ENV_SERVER_URL"),
-        )
-    else:
+    builder = _PERCEPTION_BUILDERS.get(perception_type)
+    if builder is None:
         raise ValueError(f"Unknown perception type: {perception_type}")
+    return builder(kwargs)
 
 
 if __name__ == "__main__":
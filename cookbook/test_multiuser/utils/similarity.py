@@ -0,0 +1,105 @@
+"""
+Vector similarity helpers - SIMD kernels via SimSIMD, with a NumPy fallback
+"""
+import numpy as np
+from typing import Tuple
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None  # fall back to NumPy/BLAS
+
+
+def _as_f32(x: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(x, dtype=np.float32)
+
+
+def quantize_i8(v: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    Symmetric per-vector int8 quantization
+
+    Args:
+        v: Float vector
+
+    Returns:
+        (q, scale) with v ~= q / scale; 4x smaller than float32
+    """
+    peak = float(np.max(np.abs(v))) if v.size else 0.0
+    scale = 127.0 / peak if peak > 0 else 1.0
+    return np.rint(v * scale).astype(np.int8), scale
+
+
+def dequantize_i8(q: np.ndarray, scale: float) -> np.ndarray:
+    """Inverse of quantize_i8."""
+    return q.astype(np.float32) / scale
+
+
+def cosine_i8(qa: np.ndarray, qb: np.ndarray) -> float:
+    """
+    Cosine similarity of two int8-quantized vectors (per-vector scales cancel)
+
+    Uses SimSIMD's int8 kernel (VNNI dot products where available).
+    """
+    qa, qb = np.ascontiguousarray(qa, dtype=np.int8), np.ascontiguousarray(qb, dtype=np.int8)
+    if simsimd is not None:
+        return 1.0 - float(simsimd.cosine(qa, qb))
+    a, b = qa.astype(np.int32), qb.astype(np.int32)
+    denom = np.sqrt(float(np.dot(a, a)) * float(np.dot(b, b)))
+    return float(np.dot(a, b)) / denom if denom > 0 else 0.0
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Cosine similarity between two vectors
+
+    Args:
+        a: First vector
+        b: Second vector
+
+    Returns:
+        Cosine similarity in [-1, 1]
+    """
+    a, b = _as_f32(a), _as_f32(b)
+    if simsimd is not None:
+        return 1.0 - float(simsimd.cosine(a, b))
+    denom = np.sqrt(np.vdot(a, a) * np.vdot(b, b))
+    return float(np.dot(a, b) / denom) if denom > 0 else 0.0
+
+
+def cosine_many(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of one query against every row of a matrix
+
+    Args:
+        query: Query vector, shape (D,)
+        matrix: Candidate vectors, shape (N, D)
+
+    Returns:
+        Similarities, shape (N,)
+    """
+    query, matrix = _as_f32(query), _as_f32(matrix)
+    if simsimd is not None:
+        return 1.0 - np.asarray(simsimd.cdist(query[None, :], matrix, metric="cosine"), dtype=np.float32)[0]
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    return (matrix @ query) / np.where(norms > 0, norms, 1)
+
+
+def topk(query: np.ndarray, matrix: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k most cosine-similar rows of a matrix
+
+    Args:
+        query: Query vector, shape (D,)
+        matrix: Candidate vectors, shape (N, D)
+        k: Number of results
+
+    Returns:
+        (indices, similarities), both sorted by descending similarity
+    """
+    sims = cosine_many(query, matrix)
+    k = min(k, len(sims))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    top = np.argpartition(-sims, k - 1)[:k]
+    top = top[np.argsort(-sims[top])]
+    return top, sims[top]
@@ -24,7 +24,7 @@ except ImportError:
 
 def _to_data_url(image_path: str) -> str:
     p = Path(image_path)
-    mime = "image/png" if p.suffix.lower() in [".png"] else "image/jpeg"
+    mime = {".png": "image/png", ".webp": "image/webp"}.get(p.suffix.lower(), "image/jpeg")
     b64 = base64.b64encode(p.read_bytes()).decode("utf-8")
     return f"data:{mime};base64,{b64}"
 